@@ -0,0 +1,194 @@
+'''
+Asynchronous logging for audits of many instances.
+
+ColorizingStreamHandler formats, colorizes and flushes every record on the
+thread that logs it, which serializes parallel workers on stderr and
+interleaves their output line by line. AsyncHandler only tags a record with
+the current host and puts it on a queue; a background thread formats the
+records with the ColorizingStreamHandler and writes them in batches, a batch
+ends when it contains batch_size records or when the first record in it has
+waited interval seconds.
+
+Fabric runs parallel tasks in forked processes. A fork only copies the
+thread that called fork, so a handler that notices it is running in a new
+process starts a fresh queue and writer thread, and recreates the locks that
+might have been held by the writer thread of the parent. Forked processes
+exit without running the logging shutdown hooks, call flush before a task
+returns to make sure its records are written. after_fork does the same for
+the locks of the logging module and of ordinary handlers.
+'''
+
+import os
+import time
+import Queue
+import logging
+import threading
+
+from fabric.api import env
+
+
+class BatchStream(object):
+    '''
+    File-like object that collects what a handler writes until drain is
+    called, so that a batch ends up in a single write. On Windows, colors
+    are set using console calls instead of escape codes so the stream does
+    not claim to be a terminal and the output is not colorized.
+    '''
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(data)
+
+    def flush(self):
+        # ColorizingStreamHandler flushes after every record, drain takes
+        # care of that once per batch
+        pass
+
+    def isatty(self):
+        if os.name == 'nt':
+            return False
+        isatty = getattr(self.stream, 'isatty', None)
+        return isatty and isatty()
+
+    def drain(self):
+        if self.parts:
+            self.stream.write(''.join(self.parts))
+            self.parts = []
+            self.stream.flush()
+
+
+class HostFormatter(logging.Formatter):
+    '''
+    Formatter that prefixes every continuation line of a message, such as
+    the output of a remote command, with the host it came from.
+    '''
+
+    def format(self, record):
+        lines = logging.Formatter.format(self, record).split('\n')
+        host = getattr(record, 'host', 'local')
+        return '\n'.join(lines[:1] + ['%s | %s' % (host, line) for line in lines[1:]])
+
+
+class AsyncHandler(logging.Handler):
+
+    def __init__(self, target, batch_size=100, interval=0.2):
+        logging.Handler.__init__(self)
+        self.target = target
+        self.target.stream = BatchStream(self.target.stream)
+        self.batch_size = max(batch_size, 1)
+        self.interval = max(interval, 0)
+        self.start()
+
+    def start(self):
+        self.pid = os.getpid()
+        self.queue = Queue.Queue()
+        self.target.createLock()
+        self.target.stream.parts = []
+        self.thread = threading.Thread(target=self.write, name='asynclog')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def prepare(self, record):
+        '''
+        Render the message and traceback on the calling thread, the arguments
+        might have changed by the time the writer thread formats the record.
+        '''
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        record.host = env.host_string or 'local'
+
+    def handle(self, record):
+        # checked before logging.Handler.handle takes the lock of this handler,
+        # which might have been held by another thread of the parent
+        if self.pid != os.getpid():
+            self.createLock()
+            self.start()
+        return logging.Handler.handle(self, record)
+
+    def emit(self, record):
+        try:
+            self.prepare(record)
+            self.queue.put(record)
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except:
+            self.handleError(record)
+
+    def next_batch(self):
+        batch = [self.queue.get()]
+        deadline = time.time() + self.interval
+        while len(batch) < self.batch_size and batch[-1] is not None:
+            try:
+                timeout = deadline - time.time()
+                if timeout > 0:
+                    batch.append(self.queue.get(timeout=timeout))
+                else:
+                    batch.append(self.queue.get_nowait())
+            except Queue.Empty:
+                break
+        return batch
+
+    def write(self):
+        while True:
+            batch = self.next_batch()
+            self.target.acquire()
+            try:
+                for record in batch:
+                    if record is not None:
+                        self.target.emit(record)
+                self.target.stream.drain()
+            except Exception:
+                # stderr itself is broken, there is nowhere to report this
+                pass
+            finally:
+                self.target.release()
+            for record in batch:
+                self.queue.task_done()
+            if batch[-1] is None:
+                return
+
+    def flush(self):
+        '''
+        Block until every record that was logged so far has been written.
+        '''
+        if self.pid == os.getpid() and self.thread.is_alive():
+            self.queue.join()
+
+    def close(self):
+        if self.pid == os.getpid() and self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        logging.Handler.close(self)
+
+
+_pid = os.getpid()
+
+
+def after_fork():
+    '''
+    Recreate the lock of the logging module and those of the handlers of the
+    root logger when running in a forked process. Other threads of the
+    parent, such as the ones that fetch the inventory, might have held them
+    at the time of the fork and they would never be released in the child.
+    '''
+    global _pid
+    if os.getpid() == _pid:
+        return
+    _pid = os.getpid()
+    logging._lock = threading.RLock()
+    for handler in logging.getLogger().handlers:
+        handler.createLock()
+
+
+def flush():
+    '''
+    Flush the handlers of the root logger, asynchronous or not.
+    '''
+    for handler in logging.getLogger().handlers:
+        handler.flush()
@@ -0,0 +1,127 @@
+'''
+Benchmarks for the labs migration assistant.
+
+    python benchmark.py startup [REPEAT]
+    python benchmark.py audit [INSTANCES ...]
+
+startup measures how long fab -l takes and fails if loading the fabfile
+tries to open a network connection, for example to fetch the inventory from
+Wikitech.
+
+audit runs fab test against 10, 1000 and 10000 simulated instances (see
+simulation.py), or the given numbers, and reports how long the audit took,
+how many instances per second were tested and the peak memory use. The
+simulated instances respond instantly so that the overhead of the audit
+itself is measured; any network access other than to the fake Wikitech
+fails the benchmark.
+'''
+
+import os
+import sys
+import time
+import atexit
+import socket
+import subprocess
+
+
+FABFILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fabfile.py')
+
+
+LOOPBACK = ('127.0.0.1', 'localhost', '::1')
+
+
+def guard_network():
+    '''
+    Make every attempt to open a network connection, other than to the fake
+    Wikitech of a simulation on localhost, fail and exit with status 3 at the
+    end of the process if there were any.
+    '''
+    attempts = []
+    originals = {'connect': socket.socket.connect,
+                 'create_connection': socket.create_connection,
+                 'getaddrinfo': socket.getaddrinfo}
+
+    def guarded(name, host_of):
+        def wrapper(*args, **kwargs):
+            if host_of(args) in LOOPBACK:
+                return originals[name](*args, **kwargs)
+            attempts.append(args)
+            raise socket.error('network access is not allowed during this benchmark')
+        return wrapper
+
+    def report():
+        if attempts:
+            sys.stderr.write('%d attempts to access the network\n' % len(attempts))
+            os._exit(3)
+
+    socket.socket.connect = guarded('connect', lambda args: args[1][0])
+    socket.create_connection = guarded('create_connection', lambda args: args[0][0])
+    socket.getaddrinfo = guarded('getaddrinfo', lambda args: args[0])
+    atexit.register(report)
+
+
+def fab(*args):
+    '''
+    Run fab in this process with the network guarded.
+    '''
+    guard_network()
+    from fabric.main import main
+    sys.argv = ['fab', '-f', FABFILE] + list(args)
+    main()
+
+
+def bench_startup(repeat=5):
+    timings = []
+    for run in range(repeat):
+        start = time.time()
+        with open(os.devnull, 'w') as devnull:
+            status = subprocess.call([sys.executable, __file__, 'fab', '-l',
+                                      '--set', 'wiki_username=benchmark,refresh_inventory=True'],
+                                     stdout=devnull, stderr=devnull)
+        timings.append(time.time() - start)
+        if status != 0:
+            print 'fab -l exited with status %d, did it try to access the network?' % status
+            return False
+    timings.sort()
+    print 'fab -l: min %.3fs, median %.3fs, max %.3fs (%d runs, no network access)' % (
+        timings[0], timings[len(timings) / 2], timings[-1], repeat)
+    return True
+
+
+def bench_audit(sizes=(10, 1000, 10000)):
+    print '%10s %10s %12s %12s' % ('instances', 'seconds', 'hosts/sec', 'max rss')
+    for size in sizes:
+        settings = ','.join(['wiki_username=benchmark', 'simulate=True',
+                             'simulate_instances=%d' % size, 'simulate_connect_latency=0',
+                             'simulate_command_latency=0', 'summary=aggregate'])
+        start = time.time()
+        with open(os.devnull, 'w') as devnull:
+            process = subprocess.Popen([sys.executable, __file__, 'fab', 'test', '--set', settings],
+                                       stdout=devnull, stderr=devnull)
+            pid, status, usage = os.wait4(process.pid, 0)
+        elapsed = time.time() - start
+        if status != 0:
+            print 'fab test exited with status %d for %d instances, did it try to access the network?' % (
+                os.WEXITSTATUS(status), size)
+            return False
+        # ru_maxrss is in kilobytes on Linux and in bytes on OS X
+        rss = usage.ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+        print '%10d %9.2fs %12.1f %10.1fMB' % (size, elapsed, size / elapsed, rss / 1048576.0)
+    return True
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in ('startup', 'audit', 'fab'):
+        print __doc__
+        exit(-1)
+    if sys.argv[1] == 'fab':
+        fab(*sys.argv[2:])
+    elif sys.argv[1] == 'audit':
+        sizes = [int(size) for size in sys.argv[2:]] or [10, 1000, 10000]
+        exit(0 if bench_audit(sizes) else 1)
+    else:
+        repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+        exit(0 if bench_startup(repeat) else 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+'''
+Small JSON files in the cache folder that are used to remember things
+between runs, such as the inventory and the results of previous audits.
+Files are kept per Wikitech user.
+'''
+
+import os
+import json
+import urllib
+import logging
+
+import config
+
+
+CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME', '~/.cache'),
+                         'labs-migration-assistant')
+
+
+def cache_path(kind, username, extension='json'):
+    if isinstance(username, unicode):
+        username = username.encode('utf-8')
+    filename = '%s-%s.%s' % (kind, urllib.quote(username, ''), extension)
+    return os.path.join(os.path.expanduser(config.get_str('cache_dir', CACHE_DIR)), filename)
+
+
+def read_cache(path):
+    try:
+        with open(path) as fh:
+            return json.load(fh)
+    except IOError:
+        return None
+    except ValueError, e:
+        logging.warning('Ignoring corrupt cache file %s: %s' % (path, e))
+        return None
+
+
+def write_cache(path, doc):
+    '''
+    Atomically replace the cache so that concurrent runs never read a
+    partially written file.
+    '''
+    directory = os.path.dirname(path)
+    try:
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        tmp = '%s.%d' % (path, os.getpid())
+        with open(tmp, 'w') as fh:
+            json.dump(doc, fh)
+        os.rename(tmp, path)
+    except (IOError, OSError), e:
+        logging.warning('Could not write cache file %s: %s' % (path, e))
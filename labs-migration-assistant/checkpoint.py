@@ -0,0 +1,77 @@
+'''
+Keep track of the instances that have been tested during a run so that an
+interrupted audit can be resumed using --set resume=True.
+
+Every worker appends the record of its instance, as built by
+report.host_record plus the raw output of the tests, to a JSON lines file in
+the cache folder as soon as the instance is done. A run that is not resumed
+starts with an empty checkpoint.
+'''
+
+import os
+import json
+import logging
+
+import cache
+import checks
+import report
+
+
+class Checkpoint:
+
+    def __init__(self, username):
+        self.path = cache.cache_path('checkpoint', username, 'jsonl')
+
+    def start(self):
+        directory = os.path.dirname(self.path)
+        try:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            open(self.path, 'w').close()
+        except (IOError, OSError), e:
+            logging.warning('Could not create checkpoint %s, this run cannot be resumed: %s' % (self.path, e))
+            self.path = None
+
+    def load(self):
+        '''
+        Return the records in the checkpoint keyed by host.
+        '''
+        records = {}
+        try:
+            for record in report.read_records(self.path):
+                records[record['host']] = record
+        except IOError:
+            pass
+        return records
+
+    def write(self, record, outputs):
+        if self.path is None:
+            return
+        report.append(self.path, '%s\n' % json.dumps(dict(record, outputs=outputs or {})))
+
+
+def is_complete(record, tasks):
+    return all(task in record['results'] for task in tasks)
+
+
+def restore(labinstance, record):
+    '''
+    Put the results of a checkpointed record back into a LabInstance.
+    '''
+    labinstance.connect = record['connect']
+    labinstance.timed_out = record['timed_out']
+    labinstance.connect_time = record['connect_time']
+    labinstance.command_time = record['command_time']
+    labinstance.attempts = record['attempts']
+    labinstance.timeouts = record['timeouts']
+    for task, result in record['results'].iteritems():
+        if task not in checks.names():
+            continue
+        code = checks.CODES[result]
+        if task in record['reused']:
+            labinstance.reuse(task, code)
+        elif task in record['checked']:
+            labinstance.record(task, code, record['checked'][task],
+                               record['outputs'].get(task), record['durations'].get(task))
+        else:
+            labinstance.set_result(task, code)
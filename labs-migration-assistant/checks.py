@@ -0,0 +1,451 @@
+'''
+The tests that are run against every lab instance.
+
+Tests do not run commands themselves, they declare the facts they need.
+There are two kinds of facts: remote facts are the output of a shell command
+on the instance and derived facts are computed locally from other facts. A
+remote fact can be guarded by another remote fact, in which case its command
+only runs when the command of the guard exited successfully.
+
+plan works out which remote facts the selected tests need, so every command
+runs at most once per instance no matter how many tests use its output, and
+the commands are combined into a single script by probe.build_payload so an
+instance can be audited using a single SSH round trip.
+
+Remote facts return raw output, the derived facts below parse it locally
+using parsers.py so that tests work with lists, strings, numbers and
+booleans. A FactSet computes every derived fact at most once per instance,
+so tests that need the same fact share both the command and the parsing.
+
+Other modules can register their own facts and tests using the same
+decorators, use --set check_modules=module1;module2 to load them.
+'''
+
+import re
+import logging
+
+from datetime import datetime
+
+import parsers
+
+
+# result codes, RESULTS contains their names
+PASS, WARNING, FAIL = 0, 1, 2
+RESULTS = ('PASS', 'WARNING', 'FAIL')
+CODES = {'PASS': PASS, 'OK': PASS, 'WARNING': WARNING, 'FAIL': FAIL}
+
+registry = []
+_positions = {}
+facts = {}
+
+
+class MissingFact(Exception):
+    pass
+
+
+class Fact:
+
+    def __init__(self, name, command=None, as_root=False, when=None, needs=(), compute=None):
+        self.name = name
+        self.command = command
+        self.as_root = as_root
+        self.when = when
+        self.needs = needs
+        self.compute = compute
+
+    def __str__(self):
+        return self.name
+
+    def __repr__(self):
+        return str(self)
+
+    def is_remote(self):
+        return self.command is not None
+
+    def dependencies(self):
+        if self.when is not None:
+            return (self.when,) + tuple(self.needs)
+        return tuple(self.needs)
+
+
+class FactSet:
+    '''
+    The facts of a single instance. Remote facts are taken from the results
+    of a probe, derived facts are computed the first time a test asks for
+    them and cached for the other tests. A remote fact whose guard failed is
+    None.
+    '''
+
+    def __init__(self, results):
+        self.results = results
+        self.values = {}
+
+    def __getitem__(self, name):
+        if name not in self.values:
+            fact = facts[name]
+            if fact.is_remote():
+                if name not in self.results:
+                    raise MissingFact(name)
+                self.values[name] = self.results[name].output
+            else:
+                self.values[name] = fact.compute(self)
+        return self.values[name]
+
+    def status(self, name):
+        '''
+        Return the exit status of the command of a remote fact.
+        '''
+        if name not in self.results:
+            raise MissingFact(name)
+        return self.results[name].status
+
+
+class Check:
+
+    def __init__(self, name, needs, evaluate):
+        self.name = name
+        self.needs = needs
+        self.evaluate = evaluate
+
+    def __str__(self):
+        return self.name
+
+    def __repr__(self):
+        return str(self)
+
+    def remote_facts(self):
+        '''
+        Return the names of the remote facts this test depends on, either
+        directly or through derived facts and guards.
+        '''
+        return [fact.name for fact in plan([self])]
+
+    def outputs(self, results):
+        '''
+        Return the output of the remote facts of this test that are part of
+        the results of a probe, keyed by the name of the fact.
+        '''
+        return dict((name, results[name].output)
+                    for name in self.remote_facts() if name in results)
+
+    def duration(self, results):
+        '''
+        Return how long the commands of this test took on the instance. A
+        command that is shared by several tests counts towards all of them.
+        '''
+        durations = [results[name].duration for name in self.remote_facts()
+                     if name in results and results[name].duration is not None]
+        return sum(durations)
+
+    def run(self, factset):
+        '''
+        Evaluate the facts of an instance. Returns FAIL if any of the commands
+        this test depends on did not run or if the output could not be
+        interpreted.
+        '''
+        try:
+            return self.evaluate(factset)
+        except MissingFact:
+            logging.error('Not all commands for %s were executed. [FAIL]' % self.name)
+            return FAIL
+        except Exception, e:
+            logging.error('Could not interpret the output of %s: %s [FAIL]' % (self.name, e))
+            return FAIL
+
+
+def remote_fact(name, command, as_root=False, when=None):
+    '''
+    Register the output of a shell command as a fact. The name ends up in the
+    payload as a shell variable so it has to be a valid identifier. When
+    guarded by another remote fact, the command only runs if the command of
+    that fact exited with status 0.
+    '''
+    if not re.match(r'^[A-Za-z_][A-Za-z0-9_]*$', name):
+        raise ValueError('Invalid fact name: %s' % name)
+    if when is not None and not facts[when].is_remote():
+        raise ValueError('Fact %s can only be guarded by a remote fact' % name)
+    facts[name] = Fact(name, command=command, as_root=as_root, when=when)
+
+
+def fact(*needs):
+    '''
+    Decorator to register a derived fact, the function receives the FactSet
+    of an instance and its name is the name of the fact.
+    '''
+    def decorator(func):
+        for need in needs:
+            if need not in facts:
+                raise ValueError('%s needs unknown fact %s' % (func.__name__, need))
+        facts[func.__name__] = Fact(func.__name__, needs=needs, compute=func)
+        return func
+    return decorator
+
+
+def check(*needs):
+    '''
+    Decorator to register a test. The function receives the FactSet of an
+    instance and returns PASS, WARNING or FAIL.
+    '''
+    def decorator(func):
+        for need in needs:
+            if need not in facts:
+                raise ValueError('%s needs unknown fact %s' % (func.__name__, need))
+        if func.__name__ in _positions:
+            raise ValueError('A test named %s is already registered' % func.__name__)
+        _positions[func.__name__] = len(registry)
+        registry.append(Check(func.__name__, needs, func))
+        return func
+    return decorator
+
+
+def plan(tests):
+    '''
+    Return the remote facts that are needed to run the given tests, without
+    duplicates and ordered so that every fact comes after its guard.
+    '''
+    ordered = []
+    seen = set()
+
+    def visit(name):
+        if name in seen:
+            return
+        seen.add(name)
+        fact = facts[name]
+        for dependency in fact.dependencies():
+            visit(dependency)
+        if fact.is_remote():
+            ordered.append(fact)
+
+    for test in tests:
+        for need in test.needs:
+            visit(need)
+    return ordered
+
+
+def remote_commands(tests):
+    '''
+    Return the (name, command, as_root, guard) tuples for probe.build_payload
+    that are needed to run the given tests.
+    '''
+    return [(item.name, item.command, item.as_root, item.when) for item in plan(tests)]
+
+
+def load_modules(names):
+    '''
+    Import modules that register additional facts and tests. Has to happen
+    before any LabInstance is created because those reserve room for the
+    results of every registered test.
+    '''
+    for name in names:
+        if name:
+            __import__(name)
+            logging.info('Loaded tests from %s.' % name)
+
+
+def get_check(name):
+    return registry[_positions[name]]
+
+
+def index(name):
+    '''
+    Return the position of a test in the registry, used to store results.
+    '''
+    return _positions[name]
+
+
+def names():
+    return [item.name for item in registry]
+
+
+remote_fact('puppet_conf', 'cat /etc/puppet/puppet.conf')
+remote_fact('puppet_last_run_summary', 'cat /var/lib/puppet/state/last_run_summary.yaml', as_root=True)
+remote_fact('home_listing', 'ls -1')
+remote_fact('df_home', 'df $HOME')
+remote_fact('mysql_init_scripts', 'ls -d /etc/init.d/mysql*')
+remote_fact('mysql_status', 'service mysql status', when='mysql_init_scripts')
+remote_fact('mysql_databases', 'mysql -e "show databases"', when='mysql_init_scripts')
+remote_fact('mediawiki_folder', 'test -d /var/lib/mediawiki')
+remote_fact('lsb_release', 'lsb_release -r -s')
+
+DEFAULT_PUPPETMASTER = 'virt0.wikimedia.org'
+SYSTEM_DATABASES = ('information_schema', 'performance_schema', 'mysql')
+
+
+@fact('puppet_conf')
+def puppet_servers(facts):
+    '''The puppet masters configured in puppet.conf.'''
+    if facts.status('puppet_conf') != 0:
+        raise ValueError('could not read puppet.conf: %s' % facts['puppet_conf'])
+    return parsers.config_values(facts['puppet_conf'], 'server')
+
+
+@fact('puppet_last_run_summary')
+def puppet_last_run(facts):
+    '''The time of the last puppet run in seconds since the epoch, 0 if unknown.'''
+    value = parsers.yaml_scalar(facts['puppet_last_run_summary'], 'time', 'last_run')
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return 0
+
+
+@fact('home_listing')
+def home_files(facts):
+    '''The files and folders in the home folder, hidden ones excluded.'''
+    return parsers.lines(facts['home_listing'])
+
+
+@fact('df_home')
+def home_filesystem(facts):
+    '''The filesystem that holds the home folder, host:path for NFS.'''
+    return parsers.df_filesystem(facts['df_home'])
+
+
+@fact('mysql_init_scripts')
+def mysql_installed(facts):
+    return facts.status('mysql_init_scripts') == 0
+
+
+@fact('mysql_status')
+def mysql_running(facts):
+    '''Whether MySQL is running, sysvinit and upstart style.'''
+    output = facts['mysql_status']
+    if output is None:
+        return False
+    return facts.status('mysql_status') == 0 and 'not' not in output and 'stop/' not in output
+
+
+@fact('mysql_databases')
+def mysql_user_databases(facts):
+    '''The databases other than the system ones, None if we could not log in.'''
+    if facts.status('mysql_databases') != 0:
+        return None
+    return [name for name in parsers.table_column(facts['mysql_databases'], 'Database')
+            if name not in SYSTEM_DATABASES]
+
+
+@fact('mediawiki_folder')
+def mediawiki_installed(facts):
+    return facts.status('mediawiki_folder') == 0
+
+
+@fact('lsb_release')
+def ubuntu_version(facts):
+    '''The release of Ubuntu as a float such as 12.04, None if unknown.'''
+    if facts.status('lsb_release') != 0:
+        return None
+    return parsers.version(facts['lsb_release'])
+
+
+@check('puppet_servers')
+def detect_self_puppetmaster(facts):
+    # anything else than virt0.wikimedia.org is considered a self-hosted
+    # puppetmaster
+    if all(server == DEFAULT_PUPPETMASTER for server in facts['puppet_servers']):
+        logging.info('You are not using a self-hosted puppet master. [OK]')
+        return PASS
+    else:
+        logging.error(
+            'You are running your own self-hosted puppet master. [FAIL]')
+        return FAIL
+
+
+@check('puppet_last_run')
+def detect_last_puppet_run(facts):
+    epoch = facts['puppet_last_run']
+    if epoch == 0:
+        logging.error(
+            'We could not determine the last time puppet was run. [FAIL]')
+        return FAIL
+    else:
+        epoch = datetime.fromtimestamp(epoch)
+        now = datetime.now()
+        dt = now - epoch
+        if dt.total_seconds() > 86400:
+            logging.error(
+                'The last puppet run was at least %d days ago, please run puppet. [FAIL]' % dt.days)
+            return FAIL
+        else:
+            logging.info('Puppet is up-to-date. [OK]')
+            return PASS
+
+
+@check('home_files')
+def detect_shared_storage_for_projects(facts):
+    if not facts['home_files']:
+        logging.info(
+            'You seem not to be using your home folder for storing files. [OK]')
+        return PASS
+    else:
+        logging.error(
+            'You seem to be using your home folder for storing files and folders. Please migrate your files to /data/projects/. [FAIL]')
+        return FAIL
+
+
+@check('home_filesystem')
+def detect_shared_storage_for_home(facts):
+    if ':' in facts['home_filesystem']:
+        logging.info(
+            'You seem to be using the shared storage space for your home folder. [OK]')
+        return PASS
+    else:
+        logging.warn(
+            'You do not seem to be using the shared storage space for your home folder. Please make sure that you have backups. [WARNING]')
+        return FAIL
+
+
+@check('mysql_installed', 'mysql_running', 'mysql_user_databases')
+def detect_databases(facts):
+    # mysql_status and mysql_databases are only collected when there is an
+    # init script
+    if not facts['mysql_installed']:
+        logging.info(
+            'You are not running a MySQL instance and hence you do not have to make any backups. [OK]')
+        return PASS
+    elif not facts['mysql_running']:
+        logging.warning(
+            'Your MySQL instance is not running and hence I cannot detemine if you need to make backups. [WARNING]')
+        return WARNING
+    databases = facts['mysql_user_databases']
+    if databases is None:
+        logging.error(
+            'Could not log in to your MySQL instance using default credentials, your current username and no password. [ERROR]')
+        logging.error(
+            'Please make sure that in your home folder on your lab instance there is a .my.cnf file that contains your credentials.')
+        logging.error(
+            'See for instructions http://dev.mysql.com/doc/refman/5.1/en/option-files.html')
+        return WARNING
+    elif databases:
+        logging.warn(
+            'You are running a MySQL instance and hence you should probably make a backup. [WARNING]')
+        return WARNING
+    else:
+        logging.info(
+            'You are running a MySQL database instance but it does not seem to have any databases. [OK]')
+        return PASS
+
+
+@check('mediawiki_installed')
+def detect_mediawiki(facts):
+    if facts['mediawiki_installed']:
+        logging.warning(
+            'We detected an installation of Mediawiki, please make sure you have a backup. [WARNING]')
+        return WARNING
+    logging.info(
+        'You do not have an installation of Mediawiki hence you do not have to make backups. [OK]')
+    return PASS
+
+
+@check('ubuntu_version')
+def check_ubuntu(facts):
+    min_ubuntu_version = 11.04
+    version = facts['ubuntu_version']
+    if version is None:
+        logging.warning('Was not able to determine whether your Ubuntu installation is up to date. [WARNING')
+        return WARNING
+    elif min_ubuntu_version > version:
+        logging.warning('You are running an outdated version of Ubuntu, please upgrade. [WARNING]')
+        return WARNING
+    else:
+        logging.info('You are running an up-to-date version of Ubuntu. [OK]')
+        return PASS
@@ -0,0 +1,104 @@
+'''
+Choose the number of workers while the audit is running, use
+--set workers=auto.
+
+All connections to the instances go through the bastion. Too many at once
+overload it, which shows as connection attempts that time out and as
+connections that take longer and longer, too few leave throughput unused.
+After every batch of instances the Controller looks at how connecting to
+them went. It adds step workers while connecting stays healthy and the pool
+was fully used, and halves the number of workers when more than
+max_timeout_rate of the connection attempts timed out or when the median
+connect time exceeds max_connect_time or grew to slowdown times the best
+median seen so far. The number of workers stays between min_workers and
+max_workers.
+'''
+
+import logging
+
+import config
+import timing
+
+
+# connect times below this are never considered a slowdown, relative
+# changes of small times are mostly noise
+MIN_SLOW_CONNECT_TIME = 1.0
+
+
+class Controller:
+
+    def __init__(self, initial=8, minimum=2, maximum=64, step=4, max_timeout_rate=0.1,
+                 max_connect_time=5.0, slowdown=3.0):
+        self.minimum = max(minimum, 1)
+        self.maximum = max(maximum, self.minimum)
+        self.workers = min(max(initial, self.minimum), self.maximum)
+        self.step = max(step, 1)
+        self.max_timeout_rate = max_timeout_rate
+        self.max_connect_time = max_connect_time
+        self.slowdown = slowdown
+        self.baseline = None
+
+    def assess(self, labinstances):
+        '''
+        Return whether connecting to the given instances went well and why.
+        Returns None instead of True or False when there is nothing to go by.
+        '''
+        attempts = sum(labinstance.attempts for labinstance in labinstances)
+        if attempts == 0:
+            return None, 'no connections were made'
+        timeouts = sum(labinstance.timeouts for labinstance in labinstances)
+        if timeouts > attempts * self.max_timeout_rate:
+            return False, '%d of %d connection attempts timed out' % (timeouts, attempts)
+        times = sorted(labinstance.connect_time for labinstance in labinstances
+                       if labinstance.connect and labinstance.connect_time is not None)
+        if not times:
+            return None, 'no instance could be reached'
+        median = timing.percentile(times, 0.5)
+        if median > self.max_connect_time:
+            return False, 'the median connect time was %.2f seconds' % median
+        if self.baseline is not None and median > MIN_SLOW_CONNECT_TIME and \
+                median > self.baseline * self.slowdown:
+            return False, 'the median connect time went up from %.2f to %.2f seconds' % (
+                self.baseline, median)
+        if self.baseline is None or median < self.baseline:
+            self.baseline = median
+        return True, 'the median connect time was %.2f seconds and %d of %d attempts timed out' % (
+            median, timeouts, attempts)
+
+    def update(self, labinstances):
+        '''
+        Adjust the number of workers to how connecting to the instances of
+        the last batch went and return it.
+        '''
+        healthy, reason = self.assess(labinstances)
+        workers = self.workers
+        if healthy is False:
+            workers = max(self.workers / 2, self.minimum)
+        elif healthy and len(labinstances) >= self.workers:
+            workers = min(self.workers + self.step, self.maximum)
+        if workers < self.workers:
+            logging.warning('Reducing the number of workers from %d to %d because %s.' %
+                            (self.workers, workers, reason))
+        elif workers > self.workers:
+            logging.info('Increasing the number of workers from %d to %d because %s.' %
+                         (self.workers, workers, reason))
+        else:
+            logging.info('Keeping %d workers, %s.' % (workers, reason))
+        self.workers = workers
+        return workers
+
+
+def from_env():
+    '''
+    Return a Controller configured by the settings, or None unless
+    --set workers=auto is used.
+    '''
+    if config.get_str('workers') != 'auto':
+        return None
+    return Controller(config.get_int('initial_workers', 8),
+                      config.get_int('min_workers', 2),
+                      config.get_int('max_workers', 64),
+                      config.get_int('workers_step', 4),
+                      config.get_float('max_timeout_rate', 0.1),
+                      config.get_float('max_connect_time', 5.0),
+                      config.get_float('slowdown', 3.0))
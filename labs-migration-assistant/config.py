@@ -0,0 +1,44 @@
+'''
+Helpers to read settings from fabric's env. Values passed on the command
+line using --set are always strings, these helpers convert them to the type
+that the rest of the code expects.
+'''
+
+import logging
+
+from fabric.api import env
+
+
+def get_bool(key, default=False):
+    value = env.get(key, default)
+    if isinstance(value, bool):
+        return value
+    if value is None:
+        return default
+    return str(value).lower() in ('true', 'yes', 'on', '1')
+
+
+def get_str(key, default=''):
+    value = env.get(key, default)
+    if value is None:
+        return default
+    return str(value)
+
+
+def get_int(key, default=0):
+    return _get_number(int, key, default)
+
+
+def get_float(key, default=0.0):
+    return _get_number(float, key, default)
+
+
+def _get_number(kind, key, default):
+    value = env.get(key, default)
+    if value is None or value == '':
+        return default
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        logging.warning('Ignoring invalid value for %s: %s' % (key, value))
+        return default
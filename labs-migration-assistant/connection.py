@@ -0,0 +1,183 @@
+'''
+Manage the SSH connections to the lab instances.
+
+All instances are reached through the bastion host. Fabric normally performs
+a full SSH handshake with the bastion for every worker process and again
+after every failed connection attempt. Instead we keep a single multiplexed
+OpenSSH master connection to the bastion open for the whole run; fabric
+reaches the instances using ProxyCommand channels on top of that connection.
+Set multiplex=False to fall back to fabric's own gateway support.
+'''
+
+import os
+import time
+import signal
+import socket
+import shutil
+import logging
+import tempfile
+import subprocess
+
+from pipes import quote
+from contextlib import contextmanager
+from distutils.spawn import find_executable
+
+from fabric.api import env, settings
+from fabric.state import connections
+from fabric.exceptions import NetworkError
+from fabric.network import normalize, normalize_to_string
+
+import config
+
+
+_control_dir = None
+
+
+def ssh_command(gateway, *args):
+    user, host, port = normalize(gateway)
+    command = ['ssh', '-p', str(port), '-l', user,
+               '-o', 'ControlPath=%s' % os.path.join(_control_dir, 'bastion'),
+               '-o', 'ConnectTimeout=%d' % config.get_int('timeout', 10),
+               '-o', 'BatchMode=yes']
+    if env.disable_known_hosts:
+        command.extend(['-o', 'StrictHostKeyChecking=no',
+                        '-o', 'UserKnownHostsFile=/dev/null'])
+    if env.key_filename and os.path.exists(env.key_filename):
+        command.extend(['-i', env.key_filename])
+    command.extend(args)
+    command.append(host)
+    return command
+
+
+def open_gateway():
+    '''
+    Open the multiplexed connection to the bastion and configure fabric to
+    use it. Returns False if fabric should keep using its own gateway
+    connection.
+    '''
+    global _control_dir
+    if not env.gateway or not config.get_bool('multiplex', True):
+        return False
+    if find_executable('ssh') is None:
+        logging.warning('Could not find the ssh command, not multiplexing connections to %s' % env.gateway)
+        return False
+
+    _control_dir = tempfile.mkdtemp(prefix='labs-migration-assistant-')
+    start = time.time()
+    for attempt in range(max(config.get_int('connection_attempts', 1), 1)):
+        master = ssh_command(env.gateway, '-f', '-N', '-o', 'ControlMaster=yes',
+                             '-o', 'ControlPersist=300')
+        if subprocess.call(master) == 0:
+            break
+    else:
+        logging.error('Could not open a multiplexed connection to %s, falling back to a connection per instance.' % env.gateway)
+        shutil.rmtree(_control_dir, ignore_errors=True)
+        _control_dir = None
+        return False
+    env.bastion_connect_time = time.time() - start
+    logging.info('Connected to %s in %.2f seconds' % (env.gateway, env.bastion_connect_time))
+
+    proxy = ssh_command(env.gateway, '-o', 'ControlMaster=no', '-W', '%h:%p')
+    path = os.path.join(_control_dir, 'ssh_config')
+    with open(path, 'w') as fh:
+        fh.write('Host *\n    ProxyCommand %s\n' % ' '.join(quote(arg) for arg in proxy))
+    env.bastion = env.gateway
+    env.gateway = None
+    env.use_ssh_config = True
+    env.ssh_config_path = path
+    env.pop('_ssh_config', None)
+    return True
+
+
+def close_gateway():
+    '''
+    Close the multiplexed connection to the bastion and restore fabric's
+    own gateway settings.
+    '''
+    global _control_dir
+    if _control_dir is None:
+        return
+    subprocess.call(ssh_command(env.bastion, '-O', 'exit'))
+    shutil.rmtree(_control_dir, ignore_errors=True)
+    _control_dir = None
+    env.gateway = env.bastion
+    env.use_ssh_config = False
+    env.pop('_ssh_config', None)
+
+
+class ConnectStats:
+
+    def __init__(self):
+        self.elapsed = 0.0
+        self.attempts = 0
+        self.timeouts = 0
+        self.error = None
+
+
+def is_timeout(error):
+    return isinstance(getattr(error, 'wrapped', None), socket.timeout) or \
+        'timed out' in str(error).lower()
+
+
+def connect(host_string):
+    '''
+    Make sure that there is an open connection to host_string. We do the
+    retrying ourselves instead of leaving it to fabric so that we know how
+    many attempts were needed and how many of them timed out. The returned
+    ConnectStats contains the error of the last attempt if all of them
+    failed.
+    '''
+    stats = ConnectStats()
+    start = time.time()
+    for attempt in range(max(config.get_int('connection_attempts', 1), 1)):
+        stats.attempts += 1
+        try:
+            with settings(connection_attempts=1):
+                connections[host_string]
+            stats.error = None
+            break
+        except NetworkError, e:
+            stats.error = e
+            if is_timeout(e):
+                stats.timeouts += 1
+        except SystemExit, e:
+            # fabric aborts when it would have to prompt for a password,
+            # there is no point in trying again.
+            stats.error = e
+            break
+    stats.elapsed = time.time() - start
+    return stats
+
+
+def disconnect(host_string):
+    key = normalize_to_string(host_string)
+    if key in connections:
+        connections[key].close()
+        del connections[key]
+
+
+class HostTimeout(Exception):
+    pass
+
+
+@contextmanager
+def deadline(seconds):
+    '''
+    Raise HostTimeout if the block takes longer than seconds. This uses
+    SIGALRM and thus only works in the main thread of a process, which is
+    where fabric runs tasks, both serially and in parallel.
+    '''
+    if not seconds:
+        yield
+        return
+
+    def expired(signum, frame):
+        raise HostTimeout('Did not finish within %d seconds' % seconds)
+
+    previous = signal.signal(signal.SIGALRM, expired)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
@@ -0,0 +1,81 @@
+'''
+A summary of the whole fleet instead of a summary per instance, use
+--set summary=aggregate. The records of report.host_record are grouped by
+project and by test in a single pass, only the worst offenders are kept
+while doing so, so the dashboard stays fast for tens of thousands of
+instances.
+'''
+
+import heapq
+import logging
+
+import report
+
+
+class Dashboard:
+
+    def __init__(self, tasks, worst=10):
+        self.tasks = tasks
+        self.worst = worst
+        self.projects = {}
+        self.checks = dict((task, {'PASS': 0, 'WARNING': 0, 'FAIL': 0}) for task in tasks)
+        self.offenders = []
+        self.hosts = 0
+
+    def add(self, record):
+        self.hosts += 1
+        unreachable = report.is_unreachable(record, self.tasks)
+        if unreachable:
+            # the tests of an unreachable instance fail without having run
+            problems = 1
+        else:
+            problems = record['errors'] + record['warnings']
+        project = self.projects.setdefault(record['project'], {
+            'hosts': 0, 'ready': 0, 'failed': 0, 'warnings': 0, 'unreachable': 0})
+        project['hosts'] += 1
+        if problems == 0:
+            project['ready'] += 1
+        if unreachable:
+            project['unreachable'] += 1
+        elif record['errors']:
+            project['failed'] += 1
+        elif record['warnings']:
+            project['warnings'] += 1
+        if not unreachable:
+            for task in self.tasks:
+                self.checks[task][record['results'][task]] += 1
+        if problems and self.worst:
+            item = (problems, record['host'], unreachable)
+            if len(self.offenders) < self.worst:
+                heapq.heappush(self.offenders, item)
+            else:
+                heapq.heappushpop(self.offenders, item)
+
+    def output(self):
+        logging.info('***** Dashboard of %d instances *****' % self.hosts)
+        logging.info('%-30s %6s %6s %6s %8s %11s' % (
+            'project', 'hosts', 'ready', 'failed', 'warnings', 'unreachable'))
+        for name in sorted(self.projects):
+            project = self.projects[name]
+            logging.info('%-30s %6d %6d %6d %8d %11d' % (
+                name, project['hosts'], project['ready'], project['failed'],
+                project['warnings'], project['unreachable']))
+        logging.info('%-40s %6s %8s %6s' % ('test', 'PASS', 'WARNING', 'FAIL'))
+        for task in self.tasks:
+            counts = self.checks[task]
+            logging.info('%-40s %6d %8d %6d' % (task, counts['PASS'], counts['WARNING'], counts['FAIL']))
+        if self.offenders:
+            logging.info('Instances with the most problems:')
+            for problems, host, unreachable in sorted(self.offenders, reverse=True):
+                if unreachable:
+                    logging.info('%-40s unreachable' % host)
+                else:
+                    logging.info('%-40s %d problems' % (host, problems))
+        logging.info("Use --set 'details=HOST1;HOST2' to see the results of individual instances.")
+
+
+def output_dashboard(records, tasks, worst=10):
+    dashboard = Dashboard(tasks, worst)
+    for record in records:
+        dashboard.add(record)
+    dashboard.output()
@@ -24,28 +24,34 @@ Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 '''
 
 import os
+import glob
+import time
+import sqlite3
 import logging
 import functools
 
-import yaml
-import requests
-
 from fabric.api import *  # noqa
-from datetime import datetime
+from fabric.exceptions import NetworkError, CommandTimeout
 from ansistrm import ColorizingStreamHandler
 
+import probe
+import config
+import asynclog
+import cache
+import checks
+import history
+import inventory
+import hostfilter
+import timing
+import report
+import dashboard
+import simulation
+import connection
+import concurrency
+import resultstore
+import checkpoint
+from labinstance import LabInstance
 
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
-formatter = logging.Formatter(
-    '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-handler = ColorizingStreamHandler()
-handler.setFormatter(formatter)
-logger.addHandler(handler)
-'''
-Fabric logging messages have their own hardcoded format and will thus not follow the
-formatter format. See also https://github.com/fabric/fabric/issues/163
-'''
 
 # fabric settings
 env.timeout = 10
@@ -57,93 +63,129 @@ env.connection_attempts = 3
 env.disable_known_hosts = True
 env.reject_unknown_hosts = False
 env.gateway = 'bastion.wmflabs.org'
-if 'ignored_hosts' not in env:
-    env.ignored_hosts = ''
-env.ignored_hosts = env.ignored_hosts.split(';')
 env.key_filename = os.path.join(os.path.expanduser('~'), '.ssh/id_rsa')
 
 
-class LabInstance:
+def configure_logging():
+    '''
+    Fabric logging messages have their own hardcoded format and will thus not follow the
+    formatter format. See also https://github.com/fabric/fabric/issues/163
+
+    With --set async_logging=True records are tagged with their host and written in
+    batches by a background thread, log_batch and log_flush_interval determine how many
+    records are written at once and how long a record may wait.
+    '''
+    logger = logging.getLogger()
+    logger.setLevel(logging.INFO)
+    handler = ColorizingStreamHandler()
+    if config.get_bool('async_logging'):
+        handler.setFormatter(asynclog.HostFormatter(
+            '%(asctime)s - %(host)s - %(levelname)s - %(message)s'))
+        handler = asynclog.AsyncHandler(handler,
+                                        batch_size=config.get_int('log_batch', 100),
+                                        interval=config.get_float('log_flush_interval', 0.2))
+    else:
+        handler.setFormatter(logging.Formatter(
+            '%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    logger.addHandler(handler)
+
+
+def requires_instances(func):
+    '''
+    Decorator that prepares loading the lab instances of the user before
+    running the task. audit loads them and adds them to env.labinstances and
+    env.hosts while they come in. This is deferred until a task that needs
+    hosts is actually executed so that importing this file, and thus running
+    fab -l or fab --help, does not do any network I/O.
+    '''
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if 'labinstances' not in env:
+            configure_logging()
+            if config.get_bool('simulate'):
+                simulation.start()
+            checks.load_modules(env.get('check_modules', '').split(';'))
+            if 'ignored_hosts' not in env:
+                env.ignored_hosts = ''
+            env.ignored_hosts = env.ignored_hosts.split(';')
+            try:
+                shard = hostfilter.parse_shard(config.get_str('shard'))
+            except ValueError, e:
+                abort(str(e))
+            ignore_hung_hosts()
+            try:
+                env.host_filter = hostfilter.from_env(env.ignored_hosts, shard)
+            except (IOError, ValueError), e:
+                abort('Invalid host filter: %s' % e)
+            env.labinstances = {}
+            output_settings()
+        return func(*args, **kwargs)
+    return wrapper
+
+
+def cache_name():
+    '''
+    The name under which the results and the checkpoint of this run are
+    cached. Every shard has its own so that shards can run side by side.
+    '''
+    username = env.get('wiki_username', 'debug')
+    shard = hostfilter.parse_shard(config.get_str('shard'))
+    if shard is not None:
+        return '%s-%s' % (username, shard)
+    return username
 
-    def __init__(self, name, project, datacenter):
-        self.tasks = ['detect_self_puppetmaster', 'detect_last_puppet_run',
-                      'detect_shared_storage_for_projects', 'detect_shared_storage_for_home',
-                      'detect_databases', 'detect_mediawiki', 'check_ubuntu']
-        self.name = name
-        self.project = project
-        self.datacenter = datacenter
-        self.connect = None
-        for task in self.tasks:
-            setattr(self, task, 'FAIL')
 
-    def __str__(self):
-        return '%s.%s.wmflabs' % (self.name, self.datacenter)
+def open_result_store():
+    return resultstore.ResultStore(cache_name())
 
-    def __repr__(self):
-        return str(self)
 
-    def count_errors(self):
-        return sum([1 for task in self.tasks if getattr(self, task) == 'FAIL' or getattr(self, task) == 'WARNING'])
+def ignore_hung_hosts():
+    '''
+    Add the instances that did not respond in time during the last
+    max_timeouts runs to env.ignored_hosts.
+    '''
+    max_timeouts = config.get_int('max_timeouts', 3)
+    if not max_timeouts:
+        return
+    hosts = sorted(open_result_store().timed_out_hosts(max_timeouts))
+    if hosts:
+        logging.warning('Skipping %s because they did not respond during the last %d runs, use --set max_timeouts=0 to test them anyway.' %
+                        (', '.join(hosts), max_timeouts))
+        env.ignored_hosts.extend(host.split('.')[0] for host in hosts)
 
 
 def load_lab_instances():
     '''
-    Entry point for collecting all lab instances of specified user
+    Entry point for collecting all lab instances of specified user, yields
+    them while the inventory is still being fetched.
     TODO: maybe filter for those instances where the user is admin?
     '''
     if 'debug' in env and env.debug is True:
-        test_instance = LabInstance('limn0', 'analytics', 'pmtpa')
-        labinstances = {'limn0.pmtpa.wmflabs': test_instance}
-    else:
-        labinstances = fetch_lab_instances()
-        labinstances = parse_lab_instances(labinstances)
-
-    if len(labinstances) == 0:
+        yield LabInstance('limn0', 'analytics', 'pmtpa')
+        return
+    elif 'wiki_username' not in env:
+        logging.error('Please specify your Wikitech username using --set wiki_username=YOUR_WIKI_USERNAME')
+        return
+
+    found = 0
+    for labinstance in parse_lab_instances(inventory.load_inventory(env.wiki_username)):
+        found += 1
+        yield labinstance
+    if found == 0:
         logging.error(
             'I was either not able to parse the Wikitech page containing your lab instances or you are not the administrator for any lab instance.')
 
-    return labinstances
-
 
 def parse_lab_instances(labinstances):
-    results = {}
-    for group in labinstances:
-        for resource, labinstance in group.get('results', {}).iteritems():
-            names = labinstance.get('printouts', {}).get('Instance Name', None)
-            project = labinstance.get('printouts', {}).get('Project', None)
-            dc = resource.split('.')[1]
-            # TODO: only analyse instances in Tampa, make this configurable?
-            if dc == 'pmtpa':
-                for name in names:
-                    if not name.startswith('tools') and not name.startswith('bastion') and name not in env.ignored_hosts:
-                        # ignore all tool-labs instances as they are managed by
-                        # WMF.
-                        labinstance = LabInstance(name, project, dc)
-                        results[str(labinstance)] = labinstance
-    return results
-
-
-def fetch_lab_instances():
-    logging.info('Fetching labinstances from wikitech')
-    projects_url = 'https://wikitech.wikimedia.org/w/api.php?action=ask&query=[[Member::User:%s]]&format=json' % env.wiki_username
-    verify = False  # TODO: make this configurable?
-    labinstances = []
-    try:
-        request = requests.get(projects_url, verify=verify)
-        projects = request.json().get('query', {}).get('results', {})
-        for project in projects:
-            project = project.split(':')[1].lower()
-            instances_url = 'https://wikitech.wikimedia.org/w/api.php?action=ask&query=[[Resource Type::instance]][[Project::%s]]|?Instance Name|?Project&format=json' % project
-            request = requests.get(instances_url, verify=verify)
-            labinstances.append(request.json().get('query', {}))
-    except requests.exceptions.ConnectionError, e:
-        logging.error(e)
-    except Exception, e:
-        logging.error('Caught unexpected error')
-        logging.error(e)
-    finally:
-        pass
-    return labinstances
+    '''
+    Yield a LabInstance for every instance that passes env.host_filter, see
+    hostfilter.py for the available filters.
+    '''
+    for name, project, dc in labinstances:
+        if isinstance(project, list):
+            project = ', '.join(project)
+        if env.host_filter.matches(name, project, dc):
+            yield LabInstance(name, project, dc)
 
 
 def output_settings():
@@ -156,30 +198,41 @@ def output_settings():
             logging.info('%s: \t %s' % (key, env.get(key, None)))
 
 
-def output_summary():
-    for labsinstance in env.labinstances.values():
-        logging.info('***** Summary of tests for %s *****' % labsinstance)
-        logging.info('Please fix the %d identified problems.' %
-                     labsinstance.count_errors())
-        problems = 0
-        if not labsinstance.connect:
+def output_summary(records, tasks):
+    '''
+    Log a human readable summary from the records of report.host_record.
+    '''
+    for record in records:
+        host = record['host']
+        problems = record['errors'] + record['warnings']
+        logging.info('***** Summary of tests for %s *****' % host)
+        logging.info('Please fix the %d identified problems.' % problems)
+        if record['timed_out']:
+            problems += 1
+            logging.error(
+                'Instance %s did not respond in time and has been marked as unreachable.' %
+                host)
+        elif report.is_unreachable(record, tasks):
             problems += 1
             logging.error(
                 'There were problems connecting to instance %s, please fix those problems first and then rerun this script.' %
-                labsinstance)
-
-        for test, task in enumerate(labsinstance.tasks):
-            result = getattr(labsinstance, task)
-            logging.info('Test %d: task %s: %s' % (test, task, result))
-            if result == 'FAIL' or result == 'WARNING':
-                problems += 1
+                host)
+        elif record['connect_time'] is not None:
+            logging.info('Connected in %.2f seconds, running the tests took %.2f seconds.' %
+                         (record['connect_time'], record['command_time'] or 0))
+
+        for test, task in enumerate(tasks):
+            result = record['results'][task]
+            if task in record['reused']:
+                logging.info('Test %d: task %s: %s (previous run)' % (test, task, result))
+            else:
+                logging.info('Test %d: task %s: %s' % (test, task, result))
         if problems == 0:
-            logging.info('Congratulations! %s seems ready for migration!' %
-                         labsinstance)
+            logging.info('Congratulations! %s seems ready for migration!' % host)
         else:
             logging.error(
-                '%s does not yet seem to be ready for migration to eqiad. ' % labsinstance)
-        logging.info('***** End of summary for %s *****' % labsinstance)
+                '%s does not yet seem to be ready for migration to eqiad. ' % host)
+        logging.info('***** End of summary for %s *****' % host)
         print  # empty line to make it easier to read summary output
 
 
@@ -194,202 +247,436 @@ def logged(func):
     return wrapper
 
 
-@task
-def check_connection(func, *args, **kwargs):
-    '''Check connection decorator'''
-    @functools.wraps(func)
-    def wrapper(*args, **kwargs):
-        if env.host_string is None:
-            return wrapper
-        if env.labinstances[env.host_string].connect is None:
-            # execute a simple command to verify that we have succesfully
-            # logged into the labs instance
-            try:
-                int(run('whoami | wc -l'))
-                env.labinstances[env.host_string].connect = True
-                func(*args, **kwargs)
-            except SystemExit:
-                env.labinstances[env.host_string].connect = False
-            except ValueError:
-                env.labinstances[env.host_string].connect = False
-        elif env.labinstances[env.host_string].connect is False:
-            logging.warning(
-                'Skipping task because during first test I was not able to connect to labsinstance %s.' % env.host_string)
-        else:
-            func(*args, **kwargs)
-    return wrapper
+def run_payload(commands):
+    '''
+    Run the given remote commands on the current host using a single sudo
+    call and return the output.
+    '''
+    with settings(warn_only=True):
+        return logged(sudo)(probe.build_payload(commands),
+                            timeout=config.get_int('command_timeout', 120))
 
 
-@task
-@check_connection
-def detect_self_puppetmaster():
-    result = int(run(
-        'grep "^server = virt0.wikimedia.org" /etc/puppet/puppet.conf | wc -l'))
-    if result == 0:
-        # anything else than virt0.wikimedia.org is considered a self-hosted
-        # puppetmaster
-        logging.info('You are not using a self-hosted puppet master. [OK]')
-        env.labinstances[env.host_string].detect_self_puppetmaster = 'PASS'
+def probe_host(tests):
+    '''
+    Run the remote commands of the given tests on the current host using a
+    single sudo call and store the results in its LabInstance.
+    '''
+    labinstance = env.labinstances[env.host_string]
+    if labinstance.connect is False:
+        logging.warning(
+            'Skipping task because during first test I was not able to connect to labsinstance %s.' % env.host_string)
+        return
+    commands = checks.remote_commands(tests)
+    results = None
+    # the FakeExecutor of simulation.py stands in for SSH in simulations
+    executor = env.get('executor')
+    if executor is not None:
+        connect, run_commands = executor.connect, logged(executor.run)
     else:
-        logging.error(
-            'You are running your own self-hosted puppet master. [FAIL]')
-        env.labinstances[env.host_string].detect_self_puppetmaster = 'FAIL'
+        connect, run_commands = connection.connect, run_payload
+    stats = connect(env.host_string)
+    labinstance.connect_time = stats.elapsed
+    labinstance.attempts += stats.attempts
+    labinstance.timeouts += stats.timeouts
+    if stats.error is None:
+        try:
+            start = time.time()
+            results = probe.parse_reply(run_commands(commands))
+            labinstance.command_time = time.time() - start
+        except CommandTimeout, e:
+            logging.error('%s: %s' % (env.host_string, e))
+            labinstance.timed_out = True
+        except (SystemExit, NetworkError):
+            pass
+    if not results:
+        # the payload did not run at all, either because we could not log in
+        # or because we are not allowed to use sudo on this instance.
+        labinstance.connect = False
+        return
+    labinstance.connect = True
+    now = time.time()
+    factset = checks.FactSet(results)
+    for check in tests:
+        start = time.time()
+        result = check.run(factset)
+        duration = check.duration(results) + time.time() - start
+        labinstance.record(check.name, result, now, check.outputs(results), duration)
+
+
+def parallel_pool_size(controller=None):
+    '''
+    Determine how many hosts should be audited concurrently. Returns 0 when
+    the audit should run serially. Both fab's own -P/--parallel switch and
+    --set workers=N are supported; in the former case -z/--pool-size
+    determines the size of the pool. fab resets env.parallel and
+    env.pool_size from its own options after applying --set, which is why
+    the latter uses a key of its own. With --set workers=auto the
+    concurrency.Controller decides.
+    '''
+    if env.get('parallel') is True:
+        return int(env.get('pool_size', 0)) or len(env.hosts)
+    if controller is not None:
+        return controller.workers
+    return max(config.get_int('workers', 0), 0)
 
 
-@task
-@check_connection
-def detect_last_puppet_run():
-    result = sudo('cat /var/lib/puppet/state/last_run_summary.yaml')
-    doc = yaml.load(result)
-    epoch = doc.get('time', {}).get('last_run', 0)
-    if epoch == 0:
-        logging.error(
-            'We could not determine the last time puppet was run. [FAIL]')
-        env.labinstances[env.host_string].detect_last_puppet_run = 'FAIL'
-    else:
-        epoch = datetime.fromtimestamp(epoch)
-        now = datetime.now()
-        dt = now - epoch
-        if dt.total_seconds() > 86400:
-            logging.error(
-                'The last puppet run was at least %d days ago, please run puppet. [FAIL]' % dt.days)
-            env.labinstances[env.host_string].detect_last_puppet_run = 'FAIL'
+def audit_host(tests, reporter=None, progress=None):
+    '''
+    Run the given tests against the current host and return its LabInstance.
+    When running in parallel this function is executed in a child process,
+    so the returned LabInstance is the only way to get the results back to
+    the parent process. The record of the host is added to the report and
+    the checkpoint as soon as its tests have finished.
+    '''
+    asynclog.after_fork()
+    labinstance = env.labinstances[env.host_string]
+    budget = config.get_int('host_timeout', 180)
+    try:
+        with connection.deadline(budget):
+            probe_host([check for check in tests if not labinstance.is_reused(check.name)])
+    except connection.HostTimeout:
+        logging.error('%s did not finish within %d seconds, cancelling its remaining tests.' %
+                      (env.host_string, budget))
+        labinstance.timed_out = True
+        labinstance.connect = False
+    connection.disconnect(env.host_string)
+    record = report.host_record(labinstance, [check.name for check in tests])
+    if reporter is not None:
+        reporter.write(record)
+    if progress is not None:
+        progress.write(record, labinstance.outputs)
+    # parallel workers exit without flushing the asynchronous log
+    asynclog.flush()
+    return labinstance
+
+
+def restore_results(store, tests, hosts):
+    '''
+    Reuse the results of tests that passed less than max_age seconds ago
+    instead of running them again. Returns the hosts that still have tests
+    that need to run.
+    '''
+    max_age = config.get_int('max_age', 86400)
+    remaining = []
+    for host in hosts:
+        labinstance = env.labinstances[host]
+        reused = 0
+        for check in tests:
+            if store.is_fresh(host, check.name, max_age):
+                labinstance.reuse(check.name, checks.CODES[store.get(host, check.name)['result']])
+                reused += 1
+        if reused < len(tests):
+            remaining.append(host)
         else:
-            logging.info('Puppet is up-to-date. [OK]')
-            env.labinstances[env.host_string].detect_last_puppet_run = 'PASS'
+            labinstance.connect = True
+    return remaining
 
 
-@task
-@check_connection
-def detect_shared_storage_for_projects():
-    result = int(run('ls -l | wc -l'))
-    if result == 0:
-        logging.info(
-            'You seem not to be using your home folder for storing files. [OK]')
-        env.labinstances[
-            env.host_string].detect_shared_storage_for_projects = 'PASS'
-    else:
-        logging.error(
-            'You seem to be using your home folder for storing files and folders. Please migrate your files to /data/projects/. [FAIL]')
-        env.labinstances[
-            env.host_string].detect_shared_storage_for_projects = 'FAIL'
+def open_reporter(tasks):
+    '''
+    Start the report of this run. A shard always writes one, by default to
+    shard-I-of-N.jsonl, so that the merge task can combine the shards.
+    '''
+    path = config.get_str('report')
+    shard = hostfilter.parse_shard(config.get_str('shard'))
+    if not path and shard is not None:
+        path = '%s.jsonl' % shard
+    if not path:
+        return None
+    try:
+        reporter = report.Reporter(path, tasks, env.get('report_format') or None)
+        reporter.start()
+    except (ValueError, IOError), e:
+        abort('Cannot write report %s: %s' % (path, e))
+    return reporter
 
 
-@task
-@check_connection
-def detect_shared_storage_for_home():
-    result = run('df $HOME')
-    result = result.splitlines()[1]
-    if result.find(':') > -1:
-        logging.info(
-            'You seem to be using the shared storage space for your home folder. [OK]')
-        env.labinstances[
-            env.host_string].detect_shared_storage_for_home = 'PASS'
-    else:
-        logging.warn(
-            'You do not seem to be using the shared storage space for your home folder. Please make sure that you have backups. [WARNING]')
-        env.labinstances[
-            env.host_string].detect_shared_storage_for_home = 'FAIL'
+def resume_audit(records, hosts, tasks):
+    '''
+    Restore the results of the hosts that were tested during the interrupted
+    run and return the hosts that still need to be tested.
+    '''
+    remaining = []
+    for host in hosts:
+        record = records.get(host)
+        if record is not None and checkpoint.is_complete(record, tasks):
+            checkpoint.restore(env.labinstances[host], record)
+        else:
+            remaining.append(host)
+    return remaining
 
 
-@task
-@check_connection
-def detect_databases():
+def checkpoint_hosts(progress, hosts, tasks):
+    '''
+    Add the hosts whose results were taken from a previous run, using
+    incremental or resume, to the checkpoint. audit_host only does that for
+    the hosts it tests, resuming an incremental run would test the others
+    again.
+    '''
+    for host in hosts:
+        labinstance = env.labinstances[host]
+        progress.write(report.host_record(labinstance, tasks), labinstance.outputs)
+
+
+def next_hosts(pending, limit=None):
+    '''
+    Take the lab instances that the Prefetcher pending has loaded so far, up
+    to limit, and add them to env.labinstances and env.hosts. Blocks until at
+    least one new instance has come in or until all of them have.
+    '''
+    hosts = []
+    while not hosts and not pending.finished:
+        for labinstance in pending.take(limit):
+            host = str(labinstance)
+            if host in env.labinstances:
+                continue
+            env.labinstances[host] = labinstance
+            env.hosts.append(host)
+            hosts.append(host)
+    return hosts
+
+
+def audit_batch(tests, hosts, pool_size, *args):
+    if pool_size:
+        with settings(parallel=True, pool_size=pool_size):
+            return execute(audit_host, tests, *args, hosts=hosts, exclude_hosts=env.exclude_hosts)
+    return execute(audit_host, tests, *args, hosts=hosts, exclude_hosts=env.exclude_hosts)
+
+
+def audit(tests):
+    '''
+    Run the given tests against all hosts, in parallel if requested, and
+    store the results in env.labinstances and in the result store. Returns
+    the record of every host as built by report.host_record. Every finished
+    host is checkpointed, use --set resume=True to continue an interrupted
+    audit.
+
+    Hosts are audited in batches of the instances that have been loaded so
+    far, so a cached inventory is audited in one go and one that is fetched
+    from Wikitech is audited while it is being fetched. Every batch is a
+    separate execute() with its own pool of workers, which blocks until the
+    slowest host of the batch is done; instances that come in meanwhile wait
+    for the next batch. Use --set audit_batch=N to limit the size of a batch.
+    '''
+    started = time.time()
+    tasks = [check.name for check in tests]
+    LabInstance.select(tasks)
+    reporter = open_reporter(tasks)
+    reported = set()
+    store = open_result_store()
+    progress = checkpoint.Checkpoint(cache_name())
+    finished = None
+    if config.get_bool('resume'):
+        finished = progress.load()
+    else:
+        progress.start()
+    controller = None
+    if env.get('parallel') is not True:
+        controller = concurrency.from_env()
+    batch_size = config.get_int('audit_batch', 0) or None
+    incremental = config.get_bool('incremental')
+    loaded = tested = 0
+    gateway = False
+    pending = inventory.Prefetcher(load_lab_instances())
     try:
-        result = int(run('ls /etc/init.d | grep mysql | wc -l'))
-        if result == 0:
-            logging.info(
-                'You are not running a MySQL instance and hence you do not have to make any backups. [OK]')
-            env.labinstances[env.host_string].detect_databases = 'PASS'
-        else:
-            running = run('service mysql status')
-            if running.find('not') > -1:
-                logging.warning(
-                    'Your MySQL instance is not running and hence I cannot detemine if you need to make backups. [WARNING]')
-                env.labinstances[env.host_string].detect_databases = 'WARNING'
+        while True:
+            limit = batch_size
+            if controller is not None and limit is None:
+                # the controller adjusts the number of workers between batches
+                limit = max(controller.workers * 4, 50)
+            hosts = next_hosts(pending, limit)
+            if not hosts:
+                break
+            loaded += len(hosts)
+            batch = hosts
+            if incremental:
+                hosts = restore_results(store, tests, hosts)
+            if finished is not None:
+                hosts = resume_audit(finished, hosts, tasks)
+            checkpoint_hosts(progress, [host for host in batch if host not in set(hosts)], tasks)
+            if not hosts:
+                continue
+            tested += len(hosts)
+            if not gateway:
+                connection.open_gateway()
+                gateway = True
+            # parallel=True means as many workers as there are hosts so far
+            pool_size = parallel_pool_size(controller)
+            if pool_size:
+                logging.info('Going to test %d more instances in parallel using %d workers...' %
+                             (len(hosts), pool_size))
             else:
-                result = int(run('mysql -e "show databases" | wc -l'))
-                if result > 1:
-                    # ignore information_schema database
-                    logging.warn(
-                        'You are running a MySQL instance and hence you should probably make a backup. [WARNING]')
-                    env.labinstances[
-                        env.host_string].detect_databases = 'WARNING'
-                else:
-                    logging.info(
-                        'You are running a MySQL database instance but it does not seem to have any databases. [OK]')
-                    env.labinstances[env.host_string].detect_databases = 'PASS'
-    except ValueError:
-        logging.error(
-            'Could not log in to your MySQL instance using default credentials, your current username and no password. [ERROR]')
-        logging.error(
-            'Please make sure that in your home folder on your lab instance there is a .my.cnf file that contains your credentials.')
-        logging.error(
-            'See for instructions http://dev.mysql.com/doc/refman/5.1/en/option-files.html')
-        env.labinstances[env.host_string].detect_databases = 'WARNING'
+                logging.info('Going to test %d more instances...' % len(hosts))
+            results = audit_batch(tests, hosts, pool_size, reporter, progress)
+            for host, labinstance in results.iteritems():
+                # hosts that could not be reached return the exception instead of
+                # their LabInstance, their results are already marked as failed.
+                if isinstance(labinstance, LabInstance):
+                    env.labinstances[host] = labinstance
+                    reported.add(host)
+            if controller is not None:
+                controller.update([env.labinstances[host] for host in hosts])
+    finally:
+        pending.stop()
+        connection.close_gateway()
+    if loaded > tested:
+        logging.info('Tested %d of %d instances, the results of the others were taken from a previous run.' %
+                     (tested, loaded))
+    records = []
+    for host, labinstance in env.labinstances.iteritems():
+        store.update(labinstance)
+        record = report.host_record(labinstance, tasks)
+        if reporter is not None and host not in reported:
+            # hosts that were not audited during this run, or whose worker
+            # did not make it to the end
+            reporter.write(record)
+        records.append(record)
+    store.save()
+    record_history(records, tasks, started)
+    if env.get('trace'):
+        timing.write_trace(env.trace, env.labinstances.values())
+    return records
+
+
+def history_path():
+    return cache.cache_path('history', env.get('wiki_username', 'debug'), 'sqlite')
+
+
+def record_history(records, tasks, started):
+    '''
+    Add the results of this run to the history that fab trends queries,
+    unless --set history=False is used.
+    '''
+    if not config.get_bool('history', True):
+        return
+    path = history_path()
+    try:
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        db = history.History(path)
+        try:
+            db.record(records, tasks, started, config.get_str('shard') or None)
+        finally:
+            db.close()
+    except (sqlite3.Error, OSError), e:
+        logging.warning('Could not add this run to the history in %s: %s' % (path, e))
+
+
+def select_tests(names):
+    '''
+    Return the registered tests with the given names, or all of them when no
+    names are given.
+    '''
+    if not names:
+        return list(checks.registry)
+    unknown = [name for name in names if name not in checks.names()]
+    if unknown:
+        abort('Unknown test(s): %s, use fab list_tests to see the available tests.' % ', '.join(unknown))
+    return [checks.get_check(name) for name in names]
 
 
 @task
-@check_connection
-def detect_mediawiki():
-    try:
-        result = int(
-            run('test -d /var/lib/mediawiki && echo "Mediawiki install folder exists." | wc -l'))
-        if result == 1:
-            logging.warning(
-                'We detected an installation of Mediawiki, please make sure you have a backup. [WARNING]')
-            env.labinstances[env.host_string].detect_mediawiki = 'WARNING'
-    except ValueError:
-        logging.info(
-            'You do not have an installation of Mediawiki hence you do not have to make backups. [OK]')
-        env.labinstances[env.host_string].detect_mediawiki = 'PASS'
+@runs_once
+def list_tests():
+    '''
+    List the registered tests and the remote commands they need.
+    '''
+    checks.load_modules(env.get('check_modules', '').split(';'))
+    for check in checks.registry:
+        print '%s: %s' % (check.name, ', '.join(check.remote_facts()))
 
 
 @task
-@check_connection
-def check_ubuntu():
-    min_ubuntu_version = 11.04
-    version = run('lsb_release -r -s')
-    try:
-        version = float(version)
-        if min_ubuntu_version > version:
-            logging.warning('You are running an outdated version of Ubuntu, please upgrade. [WARNING]')
-            env.labinstances[env.host_string].check_ubuntu = 'WARNING'
-        else:
-            logging.info('You are running an up-to-date version of Ubuntu. [OK]')
-            env.labinstances[env.host_string].check_ubuntu = 'OK'
-    except ValueError:
-        logging.warning('Was not able to determine whether your Ubuntu installation is up to date. [WARNING')
-        env.labinstances[env.host_string].check_ubuntu = 'WARNING'
+@runs_once
+@requires_instances
+def test(*names):
+    '''
+    Run all tests, or only the given ones: fab test:detect_databases,check_ubuntu
+    '''
+    tests = select_tests(names)
+    records = audit(tests)
+    output_results(records, [check.name for check in tests])
+    timing.output_timings(env.labinstances.values())
 
 
 @task
-@check_connection
-def test():
-    with settings(warn_only=True):
-        execute(detect_databases)
-        execute(detect_mediawiki)
-        execute(detect_self_puppetmaster)
-        execute(detect_last_puppet_run)
-        execute(detect_shared_storage_for_projects)
-        execute(detect_shared_storage_for_home)
-        execute(check_ubuntu)
-    output_summary()
+@runs_once
+def merge(*patterns):
+    '''
+    Summarize the reports of a sharded audit: fab merge:shard-*.jsonl
+    '''
+    configure_logging()
+    checks.load_modules(env.get('check_modules', '').split(';'))
+    paths = sorted(set(path for pattern in patterns or ('shard-*-of-*.jsonl',)
+                       for path in glob.glob(pattern)))
+    if not paths:
+        abort('No reports found, pass the reports of the shards like this: fab merge:shard-*.jsonl')
+    records = {}
+    for path in paths:
+        try:
+            for record in report.read_records(path):
+                records[record['host']] = record
+        except (IOError, ValueError), e:
+            abort('Cannot read report %s: %s' % (path, e))
+    records = [records[host] for host in sorted(records)]
+    tasks = merged_tasks(records)
+    logging.info('Merged %d instances from %d reports.' % (len(records), len(paths)))
+    if env.get('report'):
+        reporter = open_reporter(tasks)
+        for record in records:
+            reporter.write(record)
+    output_results(records, tasks)
+
+
+def merged_tasks(records):
     '''
-    TODO: There is a weird bug in probably my code where if you call test then it will keep looping over all
-    hosts and not exit (infinite loop afaict). The statement below is to force an exit, if you know a
-    solution to this problems then let me know.
+    Return the tests that ran on every instance of the merged reports, in
+    the order in which they are registered.
     '''
-    exit(0)
+    common = None
+    for record in records:
+        if common is None:
+            common = set(record['results'])
+        else:
+            common.intersection_update(record['results'])
+    common = common or set()
+    known = checks.names()
+    tasks = [name for name in known if name in common]
+    tasks.extend(sorted(common.difference(known)))
+    return tasks
 
 
-run = logged(run)
+def output_results(records, tasks):
+    '''
+    Log the summary of every instance, or the dashboard and the summaries of
+    the instances in --set details=HOST1;HOST2 when using --set summary=aggregate.
+    '''
+    if config.get_str('summary', 'hosts') == 'aggregate':
+        dashboard.output_dashboard(records, tasks, config.get_int('worst', 10))
+        details = set(config.get_str('details').split(';'))
+        records = [record for record in records
+                   if record['host'] in details or record['host'].split('.')[0] in details]
+    output_summary(records, tasks)
 
-env.labinstances = load_lab_instances()
-env.hosts.extend(['%s.%s.wmflabs' % (labinstance.name, labinstance.datacenter)
-                  for labinstance in env.labinstances.values()])
-logging.info('Going to test %d instances...' % len(env.hosts))
-output_settings()
+
+@task
+@runs_once
+def trends(query='runs', runs=10):
+    '''
+    Query the history of your audits: fab trends:regressions, fab trends:projects or fab trends:tests,20
+    '''
+    configure_logging()
+    path = history_path()
+    if not os.path.exists(path):
+        abort('There is no history in %s yet, run fab test first.' % path)
+    db = history.History(path)
+    try:
+        db.output(query, int(runs))
+    except ValueError, e:
+        abort(str(e))
+    finally:
+        db.close()
 
 
 def main():
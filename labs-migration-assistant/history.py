@@ -0,0 +1,209 @@
+'''
+Keep the results of every audit in a SQLite database in the cache folder so
+that trends can be queried without going through old logs or reports, use
+fab trends. Recording can be switched off using --set history=False.
+
+A run is stored as a row in runs, a row per instance in host_runs with its
+connect statistics and whether it was reachable, and a row per test of
+every reachable instance in check_results. The tables are indexed by run,
+host, project and test so that the queries below only look at the rows
+they need, however many runs are kept:
+
+    runs          the last runs and how many instances failed in them
+    regressions   tests whose result got worse since the previous run of
+                  the instance, and instances that became unreachable
+    projects      mean time to connect to and test the instances of every
+                  project
+    tests         how often every test failed or warned
+'''
+
+import time
+import sqlite3
+import logging
+
+import checks
+import report
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started REAL NOT NULL,
+    finished REAL NOT NULL,
+    shard TEXT,
+    tasks TEXT NOT NULL,
+    hosts INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS host_runs (
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    host TEXT NOT NULL,
+    project TEXT,
+    datacenter TEXT,
+    unreachable INTEGER NOT NULL,
+    errors INTEGER NOT NULL,
+    warnings INTEGER NOT NULL,
+    connect_time REAL,
+    command_time REAL,
+    attempts INTEGER NOT NULL,
+    timeouts INTEGER NOT NULL,
+    PRIMARY KEY (run_id, host)
+);
+CREATE INDEX IF NOT EXISTS host_runs_host ON host_runs (host, run_id);
+CREATE INDEX IF NOT EXISTS host_runs_project ON host_runs (project, run_id);
+CREATE TABLE IF NOT EXISTS check_results (
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    host TEXT NOT NULL,
+    check_name TEXT NOT NULL,
+    result INTEGER NOT NULL,
+    duration REAL,
+    reused INTEGER NOT NULL,
+    PRIMARY KEY (run_id, host, check_name)
+);
+CREATE INDEX IF NOT EXISTS check_results_host ON check_results (host, check_name, run_id);
+CREATE INDEX IF NOT EXISTS check_results_check ON check_results (check_name, run_id, result);
+'''
+
+# the last runs and the latest run of every host
+RECENT_RUNS = 'SELECT id FROM runs ORDER BY id DESC LIMIT ?'
+LATEST = 'SELECT host, MAX(run_id) AS run_id FROM host_runs GROUP BY host'
+
+
+class History:
+
+    def __init__(self, path):
+        self.path = path
+        # shards that finish at the same time wait for each other
+        self.db = sqlite3.connect(path, timeout=60)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def record(self, records, tasks, started, shard=None):
+        '''
+        Store the records of report.host_record for a run that started at
+        started and return the id of the run.
+        '''
+        with self.db:
+            cursor = self.db.execute(
+                'INSERT INTO runs (started, finished, shard, tasks, hosts) VALUES (?, ?, ?, ?, ?)',
+                (started, time.time(), shard, ','.join(tasks), len(records)))
+            run_id = cursor.lastrowid
+            self.db.executemany(
+                'INSERT INTO host_runs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                ((run_id, record['host'], record['project'], record['datacenter'],
+                  int(bool(report.is_unreachable(record, tasks))), record['errors'],
+                  record['warnings'], record['connect_time'], record['command_time'],
+                  record['attempts'], record['timeouts'])
+                 for record in records))
+            self.db.executemany(
+                'INSERT INTO check_results VALUES (?, ?, ?, ?, ?, ?)',
+                ((run_id, record['host'], task, checks.CODES[record['results'][task]],
+                  record['durations'].get(task), int(task in record['reused']))
+                 for record in records if not report.is_unreachable(record, tasks)
+                 for task in tasks))
+        return run_id
+
+    def runs(self, limit=10):
+        '''
+        Return the latest runs with the number of instances that were
+        unreachable and the number of reachable instances with failed tests.
+        '''
+        return self.db.execute(
+            '''SELECT runs.id, runs.started, runs.finished, runs.shard, runs.hosts,
+                      SUM(host_runs.unreachable),
+                      SUM(host_runs.errors > 0 AND host_runs.unreachable = 0)
+               FROM runs LEFT JOIN host_runs ON host_runs.run_id = runs.id
+               WHERE runs.id IN (%s) GROUP BY runs.id ORDER BY runs.id''' % RECENT_RUNS,
+            (limit,)).fetchall()
+
+    def regressions(self):
+        '''
+        Return (host, test, previous result, result) for the tests whose
+        result got worse between the latest run of an instance and the run
+        before that in which the test ran.
+        '''
+        return self.db.execute(
+            '''SELECT current.host, current.check_name, previous.result, current.result
+               FROM (%s) AS latest
+               JOIN check_results AS current
+                 ON current.run_id = latest.run_id AND current.host = latest.host
+               JOIN check_results AS previous
+                 ON previous.host = current.host AND previous.check_name = current.check_name
+                AND previous.run_id = (SELECT MAX(run_id) FROM check_results
+                                       WHERE host = current.host
+                                         AND check_name = current.check_name
+                                         AND run_id < current.run_id)
+               WHERE current.result > previous.result
+               ORDER BY current.host, current.check_name''' % LATEST).fetchall()
+
+    def newly_unreachable(self):
+        '''
+        Return the instances that were unreachable during their latest run
+        but not during the run before.
+        '''
+        return [row[0] for row in self.db.execute(
+            '''SELECT current.host
+               FROM (%s) AS latest
+               JOIN host_runs AS current
+                 ON current.run_id = latest.run_id AND current.host = latest.host
+               JOIN host_runs AS previous
+                 ON previous.host = current.host
+                AND previous.run_id = (SELECT MAX(run_id) FROM host_runs
+                                       WHERE host = current.host AND run_id < current.run_id)
+               WHERE current.unreachable = 1 AND previous.unreachable = 0
+               ORDER BY current.host''' % LATEST)]
+
+    def project_times(self, limit=10):
+        '''
+        Return (project, instances, mean connect time, mean test time) for
+        the reachable instances of every project during the last runs.
+        '''
+        return self.db.execute(
+            '''SELECT project, COUNT(DISTINCT host), AVG(connect_time), AVG(command_time)
+               FROM host_runs
+               WHERE run_id IN (%s) AND unreachable = 0 AND command_time IS NOT NULL
+               GROUP BY project ORDER BY AVG(connect_time + command_time) DESC''' % RECENT_RUNS,
+            (limit,)).fetchall()
+
+    def failing_tests(self, limit=10):
+        '''
+        Return (test, results, failures, warnings) for every test during the
+        last runs, the test that failed most often first.
+        '''
+        return self.db.execute(
+            '''SELECT check_name, COUNT(*), SUM(result = ?), SUM(result = ?)
+               FROM check_results WHERE run_id IN (%s)
+               GROUP BY check_name ORDER BY SUM(result = ?) DESC, SUM(result = ?) DESC''' % RECENT_RUNS,
+            (checks.FAIL, checks.WARNING, limit, checks.FAIL, checks.WARNING)).fetchall()
+
+    def output(self, query, limit=10):
+        if query == 'runs':
+            logging.info('%6s %-19s %8s %-14s %6s %11s %6s' % (
+                'run', 'started', 'minutes', 'shard', 'hosts', 'unreachable', 'failed'))
+            for run_id, started, finished, shard, hosts, unreachable, failed in self.runs(limit):
+                logging.info('%6d %-19s %8.1f %-14s %6d %11d %6d' % (
+                    run_id, time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(started)),
+                    (finished - started) / 60, shard or '', hosts, unreachable or 0, failed or 0))
+        elif query == 'regressions':
+            rows = self.regressions()
+            for host, task, previous, result in rows:
+                logging.warning('%-40s %-40s %s -> %s' % (
+                    host, task, checks.RESULTS[previous], checks.RESULTS[result]))
+            hosts = self.newly_unreachable()
+            for host in hosts:
+                logging.warning('%-40s became unreachable' % host)
+            logging.info('%d tests got worse and %d instances became unreachable since their previous run.' %
+                         (len(rows), len(hosts)))
+        elif query == 'projects':
+            logging.info('Mean times during the last %d runs:' % limit)
+            logging.info('%-30s %6s %8s %8s' % ('project', 'hosts', 'connect', 'tests'))
+            for project, hosts, connect_time, command_time in self.project_times(limit):
+                logging.info('%-30s %6d %8.2f %8.2f' % (project, hosts, connect_time or 0, command_time or 0))
+        elif query == 'tests':
+            logging.info('Results during the last %d runs:' % limit)
+            logging.info('%-40s %8s %6s %8s' % ('test', 'results', 'FAIL', 'WARNING'))
+            for task, results, failures, warnings in self.failing_tests(limit):
+                logging.info('%-40s %8d %6d %8d' % (task, results, failures, warnings))
+        else:
+            raise ValueError('Unknown query %s, use runs, regressions, projects or tests' % query)
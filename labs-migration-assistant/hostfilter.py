@@ -0,0 +1,163 @@
+'''
+Decide which instances to audit.
+
+Instances can be selected by datacenter, by project and by name. Names are
+matched against include and exclude rules, a rule is either an exact name,
+a glob such as web-* or, when it starts with re:, a regular expression.
+Exact names are kept in sets and all patterns of a kind are compiled into a
+single regular expression, so checking an instance does not get slower with
+the number of rules.
+
+Rules are read from the settings below, separated by semicolons, and from
+the file given by --set filter_file=FILENAME:
+
+    include       only audit instances matching one of these rules
+    exclude       never audit instances matching one of these rules
+    ignored_hosts exact names of instances not to audit
+    projects      only audit instances of these projects
+    datacenters   only audit instances in these datacenters, pmtpa by default
+    shard         I/N, only audit the I-th of N shards of the instances
+
+The file has one rule per line, for example "exclude re:^deployment-",
+"project analytics" or "datacenter pmtpa". Empty lines and lines starting
+with # are ignored. Tool Labs and bastion instances are always excluded, they
+are managed by the WMF.
+
+Instances are assigned to a shard by a CRC32 of their name, so every shard
+gets about the same number of instances and an instance stays in the same
+shard as long as the number of shards does not change, whichever runner
+fetched the inventory.
+'''
+
+import re
+import zlib
+import fnmatch
+
+import config
+
+
+DEFAULT_EXCLUDE = ('tools*', 'bastion*')
+KEYWORDS = {'include': 'include', 'exclude': 'exclude', 'ignore': 'exclude',
+            'project': 'projects', 'datacenter': 'datacenters'}
+
+
+class NameRules:
+    '''
+    A set of exact names and a compiled regular expression for the patterns.
+    '''
+
+    def __init__(self, rules):
+        self.names = set()
+        patterns = []
+        for rule in rules:
+            if rule.startswith('re:'):
+                patterns.append(rule[3:])
+            elif any(char in rule for char in '*?['):
+                patterns.append(fnmatch.translate(rule))
+            elif rule:
+                self.names.add(rule)
+        self.pattern = None
+        if patterns:
+            try:
+                self.pattern = re.compile('|'.join('(?:%s)' % pattern for pattern in patterns))
+            except re.error, e:
+                raise ValueError('Invalid pattern in %s: %s' % (', '.join(rules), e))
+
+    def __len__(self):
+        return len(self.names) + (self.pattern is not None)
+
+    def matches(self, name):
+        if name in self.names:
+            return True
+        return self.pattern is not None and self.pattern.match(name) is not None
+
+
+class Shard:
+
+    def __init__(self, index, count):
+        if not 1 <= index <= count:
+            raise ValueError('Shard %d/%d does not exist, use I/N with 1 <= I <= N' % (index, count))
+        self.index = index
+        self.count = count
+
+    def __str__(self):
+        return 'shard-%d-of-%d' % (self.index, self.count)
+
+    def contains(self, name):
+        if isinstance(name, unicode):
+            name = name.encode('utf-8')
+        return (zlib.crc32(name) & 0xffffffff) % self.count == self.index - 1
+
+
+def parse_shard(value):
+    '''
+    Return the Shard described by I/N, or None if value is empty.
+    '''
+    if not value:
+        return None
+    try:
+        index, count = [int(part) for part in value.split('/')]
+    except ValueError:
+        raise ValueError('Invalid shard %s, use I/N such as 1/4' % value)
+    return Shard(index, count)
+
+
+class HostFilter:
+
+    def __init__(self, include=(), exclude=(), projects=(), datacenters=(), shard=None):
+        self.include = NameRules(include)
+        self.exclude = NameRules(tuple(exclude) + DEFAULT_EXCLUDE)
+        self.projects = set(projects)
+        self.datacenters = set(datacenters)
+        self.shard = shard
+
+    def matches(self, name, project, datacenter):
+        if self.datacenters and datacenter not in self.datacenters:
+            return False
+        if self.projects and not self.projects.intersection((project or '').split(', ')):
+            return False
+        if self.shard is not None and not self.shard.contains(name):
+            return False
+        if self.exclude.matches(name):
+            return False
+        return not self.include or self.include.matches(name)
+
+
+def split(value):
+    return [item.strip() for item in value.split(';') if item.strip()]
+
+
+def read_rules(path):
+    '''
+    Return the rules in a filter file as a dictionary of lists keyed by the
+    name of the corresponding setting.
+    '''
+    rules = dict((key, []) for key in KEYWORDS.values())
+    with open(path) as fh:
+        for number, line in enumerate(fh, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            fields = line.split(None, 1)
+            if len(fields) != 2 or fields[0] not in KEYWORDS:
+                raise ValueError('%s, line %d: expected one of %s followed by a value' %
+                                 (path, number, ', '.join(sorted(KEYWORDS))))
+            rules[KEYWORDS[fields[0]]].append(fields[1])
+    return rules
+
+
+def from_env(ignored_hosts=(), shard=None):
+    '''
+    Build the HostFilter that is described by the settings and the filter
+    file. ignored_hosts are excluded as well and only instances in shard,
+    if given, are selected.
+    '''
+    rules = dict((key, split(config.get_str(key))) for key in set(KEYWORDS.values()))
+    rules['exclude'].extend(name for name in ignored_hosts if name)
+    if config.get_str('filter_file'):
+        for key, values in read_rules(config.get_str('filter_file')).iteritems():
+            rules[key].extend(values)
+    if not rules['datacenters']:
+        rules['datacenters'] = ['pmtpa']
+    return HostFilter(rules['include'], rules['exclude'], rules['projects'], rules['datacenters'],
+                      shard)
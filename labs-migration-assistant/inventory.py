@@ -0,0 +1,266 @@
+'''
+Fetch the lab instances of a user from Wikitech.
+
+Wikitech uses Semantic MediaWiki to keep track of projects and instances. We
+first ask for the projects that the user is a member of and then fetch the
+instances of those projects concurrently, reusing the HTTPS connections of a
+single requests.Session. Every response is parsed as soon as it arrives and
+its instances are handed to the caller right away, so auditing can start
+while the inventory is still being fetched. A Prefetcher runs the fetching
+in the background so that the caller can take all instances that have
+arrived so far at once.
+
+The instances are cached on disk per Wikitech user so that repeated runs do
+not have to wait for Wikitech. The cache expires after inventory_ttl seconds,
+set refresh_inventory=True to ignore it or offline=True to never fetch. Use
+api_url to talk to another wiki, such as the fake one of simulation.py.
+'''
+
+import time
+import Queue
+import logging
+import threading
+
+from multiprocessing.pool import ThreadPool
+
+import requests
+
+import cache
+import config
+
+
+API_URL = 'https://wikitech.wikimedia.org/w/api.php'
+
+
+def create_session(pool_size):
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1,
+                                            pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.verify = False  # TODO: make this configurable?
+    return session
+
+
+def ask_pages(session, query):
+    '''
+    Run a Semantic MediaWiki ask query and yield the 'query' part of every
+    response as soon as it arrives. SMW returns a limited number of results
+    per request, the query-continue-offset of each response is used to
+    fetch the rest.
+    '''
+    offset = 0
+    while True:
+        params = {'action': 'ask', 'format': 'json', 'query': query}
+        if offset:
+            params['query'] = '%s|offset=%d' % (query, offset)
+        response = session.get(config.get_str('api_url', API_URL), params=params,
+                               timeout=config.get_int('inventory_timeout', 60))
+        response.raise_for_status()
+        doc = response.json()
+        yield doc.get('query', {})
+        next_offset = doc.get('query-continue-offset')
+        if not next_offset or int(next_offset) <= offset:
+            return
+        offset = int(next_offset)
+
+
+def fetch_projects(session, username):
+    projects = []
+    for page in ask_pages(session, '[[Member::User:%s]]' % username):
+        for project in page.get('results', {}):
+            projects.append(project.split(':')[1].lower())
+    return projects
+
+
+def fetch_project(session, project, results):
+    '''
+    Fetch all instances of a single project and put them on the results
+    queue page by page, as (project, instances, None) tuples, followed by
+    (project, None, error) where error is None if all pages were fetched.
+    '''
+    try:
+        for page in ask_pages(session, '[[Resource Type::instance]][[Project::%s]]|?Instance Name|?Project' % project):
+            results.put((project, parse_instances(page), None))
+        results.put((project, None, None))
+    except Exception, e:
+        results.put((project, None, e))
+
+
+def stream_lab_instances(session, projects, failed):
+    '''
+    Fetch the instances of the given projects concurrently and yield them
+    as (project, instances) tuples as soon as a page has been parsed, so
+    that only the instances are kept and not the responses. Projects that
+    could not be fetched completely are appended to failed.
+    '''
+    concurrency = max(config.get_int('inventory_concurrency', 8), 1)
+    results = Queue.Queue()
+    pool = ThreadPool(min(concurrency, len(projects)) or 1)
+    pool.map_async(lambda project: fetch_project(session, project, results), projects)
+    pool.close()
+    remaining = len(projects)
+    try:
+        while remaining:
+            project, instances, error = results.get()
+            if instances is not None:
+                yield project, instances
+                continue
+            remaining -= 1
+            if error is not None:
+                logging.error('Could not fetch the instances of project %s: %s' % (project, error))
+                failed.append(project)
+    finally:
+        if remaining:
+            pool.terminate()
+        pool.join()
+
+
+def parse_instances(page):
+    '''
+    Return the name, project and datacenter of all instances in a single
+    page of query results.
+    '''
+    instances = []
+    for resource, labinstance in page.get('results', {}).iteritems():
+        names = labinstance.get('printouts', {}).get('Instance Name', None)
+        project = labinstance.get('printouts', {}).get('Project', None)
+        dc = resource.split('.')[1]
+        for name in names or []:
+            instances.append((name, project, dc))
+    return instances
+
+
+def load_inventory(username):
+    '''
+    Yield the name, project and datacenter of all instances of username,
+    from the cache if it is fresh enough and from Wikitech otherwise. When
+    fetching, instances are yielded while the rest is still being fetched.
+    Projects that could not be fetched are taken from the cache, no matter
+    how old it is.
+    '''
+    path = cache.cache_path('inventory', username)
+    doc = cache.read_cache(path)
+    if doc is not None:
+        age = time.time() - doc.get('fetched', 0)
+        if config.get_bool('offline'):
+            logging.info('Using inventory cached %d minutes ago (offline mode)' % (age / 60))
+            for instance in flatten(doc['projects']):
+                yield instance
+            return
+        if age < config.get_int('inventory_ttl', 86400) and not config.get_bool('refresh_inventory'):
+            logging.info('Using inventory cached %d minutes ago, use --set refresh_inventory=True to refresh it' % (age / 60))
+            for instance in flatten(doc['projects']):
+                yield instance
+            return
+    elif config.get_bool('offline'):
+        logging.error('There is no cached inventory for %s, cannot run in offline mode.' % username)
+        return
+
+    logging.info('Fetching labinstances from wikitech')
+    cached = doc['projects'] if doc is not None else {}
+    session = create_session(max(config.get_int('inventory_concurrency', 8), 1))
+    try:
+        projects = fetch_projects(session, username)
+    except Exception, e:
+        logging.error('Could not fetch the projects of %s: %s' % (username, e))
+        if cached:
+            logging.warning('Could not reach Wikitech, falling back to the cached inventory')
+        for instance in flatten(cached):
+            yield instance
+        session.close()
+        return
+
+    fetched = {}
+    failed = []
+    try:
+        for project, instances in stream_lab_instances(session, projects, failed):
+            fetched.setdefault(project, []).extend(instances)
+            for instance in instances:
+                yield instance
+    finally:
+        session.close()
+    for project in failed:
+        if project in cached:
+            logging.warning('Using the cached instances of project %s' % project)
+            # some pages of the project might have been fetched already
+            seen = set(instance[0] for instance in fetched.get(project, []))
+            for instance in cached[project]:
+                if instance[0] not in seen:
+                    yield tuple(instance)
+            fetched[project] = cached[project]
+        else:
+            logging.error('Skipping the instances of project %s because they could not be fetched' % project)
+            fetched.pop(project, None)
+    cache.write_cache(path, {'fetched': time.time(), 'projects': fetched})
+
+
+def flatten(projects):
+    instances = []
+    for project in sorted(projects):
+        instances.extend(tuple(instance) for instance in projects[project])
+    return instances
+
+
+class Prefetcher:
+    '''
+    Iterate over items, such as the instances yielded by load_inventory, in a
+    background thread.
+    '''
+
+    done = object()
+
+    def __init__(self, items):
+        self.queue = Queue.Queue()
+        self.finished = False
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, args=(items,), name='inventory')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self, items):
+        try:
+            for item in items:
+                if self.stopped.is_set():
+                    # let load_inventory close its session and thread pool
+                    if hasattr(items, 'close'):
+                        items.close()
+                    break
+                self.queue.put(item)
+        except Exception, e:
+            logging.error('Could not load all lab instances: %s' % e)
+        finally:
+            self.queue.put(self.done)
+
+    def stop(self):
+        '''
+        Stop iterating once the item that is being loaded has come in and
+        wait for the background thread to finish, so that it is not killed
+        halfway when the interpreter exits.
+        '''
+        self.stopped.set()
+        # join() without a timeout cannot be interrupted using Ctrl+C
+        while self.thread.is_alive():
+            self.thread.join(0.1)
+
+    def take(self, limit=None, idle=0.1):
+        '''
+        Wait for the next item and return it together with the items that
+        follow it within idle seconds of each other, up to limit items. A
+        cached inventory thus comes in a single piece and one that is being
+        fetched in the pieces that Wikitech returns. Returns an empty list
+        once all items have been taken.
+        '''
+        items = []
+        timeout = None
+        while not self.finished and (limit is None or len(items) < limit):
+            try:
+                item = self.queue.get(timeout=timeout)
+            except Queue.Empty:
+                break
+            if item is self.done:
+                self.finished = True
+            else:
+                items.append(item)
+                timeout = idle
+        return items
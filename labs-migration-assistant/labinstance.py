@@ -0,0 +1,130 @@
+'''
+The record that is kept for every lab instance during an audit.
+
+Inventories can contain tens of thousands of instances, so the record uses
+__slots__ and stores the result of every test as a single byte, indexed by
+the position of the test in checks.registry. The number of failed tests and
+warnings is kept up-to-date while results are set so that summaries do not
+have to look at the individual results. Only the tests that were selected
+for the run, see LabInstance.select, are counted.
+'''
+
+import checks
+
+from checks import WARNING, FAIL, RESULTS
+
+
+_strings = {}
+
+
+def shared(value):
+    '''
+    Return a shared copy of value, there are only a few distinct projects and
+    datacenters so there is no need to keep a copy per instance.
+    '''
+    return _strings.setdefault(value, value)
+
+
+class LabInstance(object):
+
+    __slots__ = ('name', 'project', 'datacenter', 'connect', 'connect_time',
+                 'command_time', 'attempts', 'timeouts', 'timed_out', 'results',
+                 'errors', 'warnings', 'reused', 'checked', 'outputs', 'timings')
+
+    # bitmask of the tests that are counted, None counts all of them
+    selected = None
+
+    @classmethod
+    def select(cls, tasks):
+        '''
+        Only count the results of the given tests in errors and warnings. Has
+        to be called before the instances of the run are created.
+        '''
+        cls.selected = 0
+        for task in tasks:
+            cls.selected |= 1 << checks.index(task)
+
+    def __init__(self, name, project, datacenter):
+        self.name = name
+        self.project = shared(project)
+        self.datacenter = shared(datacenter)
+        self.connect = None
+        self.connect_time = None
+        self.command_time = None
+        self.attempts = 0
+        self.timeouts = 0
+        # whether the instance exceeded its time budget
+        self.timed_out = False
+        self.results = bytearray([FAIL]) * len(checks.registry)
+        # every test fails until it has run
+        if self.selected is None:
+            self.errors = len(self.results)
+        else:
+            self.errors = bin(self.selected).count('1')
+        self.warnings = 0
+        # bitmask of the tests whose result was taken from a previous run
+        self.reused = 0
+        # timestamps, raw output and duration of the tests that ran, only
+        # allocated once the instance has actually been tested
+        self.checked = None
+        self.outputs = None
+        self.timings = None
+
+    def __str__(self):
+        return '%s.%s.wmflabs' % (self.name, self.datacenter)
+
+    def __repr__(self):
+        return str(self)
+
+    def __getstate__(self):
+        return tuple(getattr(self, slot) for slot in self.__slots__)
+
+    def __setstate__(self, state):
+        for slot, value in zip(self.__slots__, state):
+            setattr(self, slot, value)
+
+    def get_result(self, task):
+        return self.results[checks.index(task)]
+
+    def set_result(self, task, result):
+        position = checks.index(task)
+        if self.is_counted(position):
+            self._count(self.results[position], -1)
+            self._count(result, 1)
+        self.results[position] = result
+
+    def is_counted(self, position):
+        return self.selected is None or bool(self.selected & (1 << position))
+
+    def _count(self, result, delta):
+        if result == FAIL:
+            self.errors += delta
+        elif result == WARNING:
+            self.warnings += delta
+
+    def record(self, task, result, timestamp, output, duration):
+        '''
+        Store the result of a test that just ran, including the raw output
+        of its remote commands and how long it took.
+        '''
+        if self.checked is None:
+            self.checked = {}
+            self.outputs = {}
+            self.timings = {}
+        self.set_result(task, result)
+        self.checked[task] = timestamp
+        self.outputs[task] = output
+        self.timings[task] = duration
+
+    def reuse(self, task, result):
+        '''
+        Use the result of a previous run instead of running the test again.
+        '''
+        self.set_result(task, result)
+        self.reused |= 1 << checks.index(task)
+
+    def is_reused(self, task):
+        return bool(self.reused & (1 << checks.index(task)))
+
+    def result_name(self, task):
+        return RESULTS[self.get_result(task)]
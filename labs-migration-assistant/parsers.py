@@ -0,0 +1,128 @@
+'''
+Parse the raw output of remote commands into plain Python values.
+
+Remote facts fetch raw output, such as a directory listing or the output of
+df, instead of piping it through grep or wc on the instance. The derived
+facts in checks.py use these parsers to turn that output into lists,
+strings and numbers, so a test never has to interpret text itself and
+output that cannot be parsed results in None or ValueError rather than in
+a wrong result.
+'''
+
+import re
+
+import yaml
+
+# the C loader is an optional part of PyYAML
+SafeLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+def lines(output):
+    '''
+    Return the non-empty lines of output without surrounding whitespace.
+    '''
+    if not output:
+        return []
+    return [line.strip() for line in output.splitlines() if line.strip()]
+
+
+def config_values(output, key):
+    '''
+    Return the values of key in the output of an ini style configuration
+    file, such as puppet.conf, in the order in which they appear. Comments
+    are ignored.
+    '''
+    pattern = re.compile(r'^%s\s*=\s*(.*?)\s*$' % re.escape(key))
+    values = []
+    for line in lines(output):
+        if line.startswith('#') or line.startswith(';'):
+            continue
+        match = pattern.match(line)
+        if match:
+            values.append(match.group(1))
+    return values
+
+
+def df_filesystem(output):
+    '''
+    Return the filesystem column of the output of df for a single path.
+    df puts the other columns on a line of their own when the name of the
+    filesystem is long, the name is always the first field after the header.
+    '''
+    rows = lines(output)
+    if len(rows) < 2 or not rows[0].startswith('Filesystem'):
+        raise ValueError('unexpected output of df: %r' % output)
+    return rows[1].split()[0]
+
+
+def version(output):
+    '''
+    Return output that consists of a version number, such as 12.04, as a
+    float, or None if it is something else.
+    '''
+    match = re.match(r'^\s*(\d+(?:\.\d+)?)\s*$', output or '')
+    if match is None:
+        return None
+    return float(match.group(1))
+
+
+def table_column(output, header):
+    '''
+    Return the values of the single column table that mysql prints in batch
+    mode, the first line is the name of the column.
+    '''
+    rows = lines(output)
+    if not rows or rows[0] != header:
+        raise ValueError('expected a table with column %s: %r' % (header, output))
+    return rows[1:]
+
+
+def yaml_scalar(output, *path):
+    '''
+    Return the scalar at path in a YAML document as a string, or None if it
+    is not there. Documents made of block mappings, like puppet's
+    last_run_summary.yaml, are scanned line by line up to the value instead
+    of being parsed. Other documents are parsed using the safe loader.
+    '''
+    indents = []
+    expected = None
+    for line in (output or '').splitlines():
+        stripped = line.strip()
+        if not stripped or stripped.startswith('#') or stripped in ('---', '...'):
+            continue
+        indent = len(line) - len(line.lstrip())
+        if indents and indent <= indents[-1]:
+            # the mapping of the last key that matched ended
+            break
+        if expected is None:
+            expected = indent
+        if indent != expected:
+            continue
+        match = re.match(r'^([\w.-]+):(?:\s+(.*))?$', stripped)
+        if match is None:
+            break
+        if match.group(1) == path[len(indents)]:
+            value = match.group(2)
+            if len(indents) == len(path) - 1:
+                if value is None or value[:1] in '\'"&*!|>[{':
+                    break
+                return value.split(' #')[0].strip()
+            if value is not None:
+                break
+            indents.append(indent)
+            expected = None
+    return _load_scalar(output, path)
+
+
+def _load_scalar(output, path):
+    try:
+        value = yaml.load(output or '', Loader=SafeLoader)
+    except yaml.YAMLError:
+        return None
+    for key in path:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    if value is None or isinstance(value, (dict, list)):
+        return None
+    return str(value)
@@ -0,0 +1,105 @@
+'''
+Combine the remote commands of a number of tests into a single shell script
+so that a lab instance can be audited using a single SSH round trip.
+
+The output of every command is wrapped in begin and end markers, the end
+marker also records the exit status of the command. Both markers contain a
+timestamp so that we know how long every command took on the instance.
+Commands can be guarded by an earlier command so that, for example, MySQL is
+only queried on instances that have a MySQL init script.
+parse_reply turns the output of the script back into a dictionary of
+CommandResult tuples.
+'''
+
+from collections import namedtuple
+
+
+MARKER = '@@labs-migration-assistant@@'
+
+CommandResult = namedtuple('CommandResult', ['output', 'status', 'duration'])
+
+
+def quote(command):
+    return "'%s'" % command.replace("'", "'\\''")
+
+
+def build_payload(commands):
+    '''
+    Build a shell script from a list of (name, command, as_root, guard)
+    tuples. The script is meant to be executed using sudo, commands that do
+    not need to run as root are executed as the invoking user from within
+    their home folder, just like fabric's run() would do. The exit status of
+    every command is kept in a shell variable so that a command with a guard
+    is only executed when the command named by the guard exited with status
+    0, otherwise a skip marker is written instead.
+    '''
+    lines = []
+    for name, command, as_root, guard in commands:
+        if not as_root:
+            command = 'sudo -H -u "${SUDO_USER:-$USER}" /bin/sh -c %s' % quote(
+                'cd && %s' % command)
+        block = '; '.join([
+            'echo "%s begin %s $(date +%%s.%%N)"' % (MARKER, name),
+            '(%s) 2>&1' % command,
+            'status_%s=$?' % name,
+            'echo "%s end %s $status_%s $(date +%%s.%%N)"' % (MARKER, name, name)])
+        if guard is not None:
+            block = 'if [ "$status_%s" = 0 ]; then %s; else echo "%s skip %s"; fi' % (
+                guard, block, MARKER, name)
+        lines.append(block)
+    return '; '.join(lines)
+
+
+def parse_reply(reply):
+    '''
+    Parse the output of a script created by build_payload. Commands that did
+    not finish, for example because the connection was lost, are missing from
+    the returned dictionary. Commands that were skipped because of their guard
+    have a CommandResult without output, status and duration. Malformed
+    marker lines are ignored, a command whose end marker is garbled is
+    treated as not finished.
+    '''
+    results = {}
+    name = None
+    output = []
+    started = None
+    for line in reply.splitlines():
+        line = line.rstrip('\r')
+        if line.startswith(MARKER):
+            fields = line.split()
+            if len(fields) < 2:
+                continue
+            if fields[1] == 'begin' and len(fields) == 4:
+                name = fields[2]
+                output = []
+                started = parse_timestamp(fields[3])
+            elif fields[1] == 'end' and len(fields) == 5 and fields[2] == name:
+                status = parse_status(fields[3])
+                if status is None:
+                    continue
+                finished = parse_timestamp(fields[4])
+                duration = None
+                if started is not None and finished is not None:
+                    duration = finished - started
+                results[name] = CommandResult('\n'.join(output), status, duration)
+                name = None
+            elif fields[1] == 'skip' and len(fields) == 3:
+                results[fields[2]] = CommandResult(None, None, None)
+        elif name is not None:
+            output.append(line)
+    return results
+
+
+def parse_timestamp(value):
+    # date on the instance might not support %N
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def parse_status(value):
+    try:
+        return int(value)
+    except ValueError:
+        return None
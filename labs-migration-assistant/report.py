@@ -0,0 +1,126 @@
+'''
+Stream a record per instance to a report file as soon as its tests have
+finished, use --set report=FILENAME. Records are written as JSON lines, or
+as CSV when the filename ends in .csv or --set report_format=csv is used.
+
+Every record is appended using a single write on a file that is opened in
+append mode, so parallel workers can write to the same report without
+mangling each other's lines and the report can be followed with tail -f
+while the audit is running.
+'''
+
+import os
+import csv
+import json
+import logging
+import StringIO
+
+
+FIELDS = ('host', 'project', 'datacenter', 'connect', 'timed_out', 'errors',
+          'warnings', 'connect_time', 'command_time', 'attempts', 'timeouts')
+
+
+def host_record(labinstance, tasks):
+    '''
+    Return the record of an instance for the given tests, which have to be
+    the tests that were selected for the run, see LabInstance.select.
+    '''
+    results = dict((task, labinstance.result_name(task)) for task in tasks)
+    record = {
+        'host': str(labinstance),
+        'project': labinstance.project,
+        'datacenter': labinstance.datacenter,
+        'connect': labinstance.connect,
+        'timed_out': labinstance.timed_out,
+        'errors': labinstance.errors,
+        'warnings': labinstance.warnings,
+        'connect_time': labinstance.connect_time,
+        'command_time': labinstance.command_time,
+        'attempts': labinstance.attempts,
+        'timeouts': labinstance.timeouts,
+        'results': results,
+        'reused': [task for task in tasks if labinstance.is_reused(task)],
+        'durations': dict((task, (labinstance.timings or {}).get(task)) for task in tasks),
+        'checked': dict((task, timestamp) for task, timestamp in (labinstance.checked or {}).iteritems()
+                        if task in results),
+    }
+    return record
+
+
+def is_unreachable(record, tasks):
+    '''
+    An instance is unreachable if it did not respond in time or if we could
+    not connect while some of the tests had to run.
+    '''
+    return record['timed_out'] or (not record['connect'] and len(record['reused']) < len(tasks))
+
+
+def read_records(path):
+    '''
+    Yield the records in a JSON lines report, such as the partial report of
+    a shard. The last line might be incomplete if the run was killed while
+    writing it.
+    '''
+    if path.endswith('.csv'):
+        raise ValueError('only JSON lines reports can be read back')
+    with open(path) as fh:
+        for line in fh:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                logging.warning('Ignoring incomplete record in %s' % path)
+
+
+def encode(value):
+    if value is None:
+        return ''
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
+
+
+class Reporter:
+
+    def __init__(self, path, tasks, format=None):
+        self.path = path
+        self.tasks = tasks
+        if format is None:
+            format = 'csv' if path.endswith('.csv') else 'jsonl'
+        if format not in ('csv', 'jsonl'):
+            raise ValueError('Unknown report format: %s' % format)
+        self.format = format
+
+    def columns(self):
+        return list(FIELDS) + list(self.tasks) + ['reused']
+
+    def start(self):
+        '''
+        Truncate the report, CSV reports start with a header.
+        '''
+        with open(self.path, 'w') as fh:
+            if self.format == 'csv':
+                csv.writer(fh).writerow(self.columns())
+
+    def serialize(self, record):
+        if self.format == 'jsonl':
+            return '%s\n' % json.dumps(record, sort_keys=True)
+        row = [record[field] for field in FIELDS]
+        row.extend(record['results'].get(task) for task in self.tasks)
+        row.append(';'.join(record['reused']))
+        buf = StringIO.StringIO()
+        csv.writer(buf).writerow([encode(value) for value in row])
+        return buf.getvalue()
+
+    def write(self, record):
+        append(self.path, self.serialize(record))
+
+
+def append(path, data):
+    '''
+    Append data to the file at path using a single write, see above.
+    '''
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0644)
+    try:
+        os.write(fd, data)
+    finally:
+        os.close(fd)
@@ -0,0 +1,60 @@
+'''
+Remember the result of every test on every instance between runs. For each
+test we store when it ran, its result and the raw output of its remote
+commands. In incremental mode tests that passed recently are not run again.
+
+We also count for how many consecutive runs an instance did not respond in
+time so that instances that keep hanging can be skipped automatically.
+'''
+
+import time
+
+import cache
+
+
+class ResultStore:
+
+    def __init__(self, username):
+        self.path = cache.cache_path('results', username)
+        doc = cache.read_cache(self.path) or {}
+        self.hosts = doc.get('results', {})
+        self.timeouts = doc.get('timeouts', {})
+
+    def get(self, host, task):
+        return self.hosts.get(host, {}).get(task)
+
+    def is_fresh(self, host, task, max_age):
+        '''
+        A test is fresh if it passed less than max_age seconds ago.
+        '''
+        entry = self.get(host, task)
+        if entry is None or entry['result'] in ('FAIL', 'WARNING'):
+            return False
+        return time.time() - entry['time'] < max_age
+
+    def timed_out_hosts(self, limit):
+        '''
+        Return the hosts that did not respond in time during the last limit
+        runs.
+        '''
+        return [host for host, count in self.timeouts.iteritems() if count >= limit]
+
+    def update(self, labinstance):
+        host = str(labinstance)
+        if labinstance.timed_out or (labinstance.connect is False and
+                                     0 < labinstance.attempts == labinstance.timeouts):
+            self.timeouts[host] = self.timeouts.get(host, 0) + 1
+        elif labinstance.connect:
+            self.timeouts.pop(host, None)
+        if not labinstance.checked:
+            return
+        results = self.hosts.setdefault(host, {})
+        for task, timestamp in labinstance.checked.iteritems():
+            results[task] = {
+                'time': timestamp,
+                'result': labinstance.result_name(task),
+                'output': labinstance.outputs.get(task),
+            }
+
+    def save(self):
+        cache.write_cache(self.path, {'results': self.hosts, 'timeouts': self.timeouts})
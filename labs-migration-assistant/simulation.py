@@ -0,0 +1,218 @@
+'''
+Audit simulated instances without a network, use --set simulate=True.
+
+A fake Wikitech api.php is started on localhost. It answers the Semantic
+MediaWiki ask queries of inventory.py for simulate_instances instances,
+spread over simulate_projects projects, using the same pagination as the
+real wiki. The instances are audited by a FakeExecutor instead of SSH. It
+waits simulate_connect_latency seconds to connect, fails to connect to
+simulate_failure_rate of the instances and answers the payload of a probe
+after simulate_command_latency seconds with canned output for every remote
+fact. simulate_problem_rate of the instances get output that makes the
+tests fail and simulate_slow_rate of them take simulate_slow_latency
+seconds longer to answer. Each instance behaves the same way in every run, independent
+of the order in which they are audited.
+
+Unless a cache_dir is given, the simulated inventory and results are kept in
+a temporary folder so that they do not end up next to real ones, the folder
+is removed when fab exits.
+'''
+
+import re
+import time
+import json
+import atexit
+import shutil
+import random
+import logging
+import tempfile
+import threading
+import urlparse
+import BaseHTTPServer
+import SocketServer
+
+from fabric.api import env
+
+import probe
+import config
+import connection
+
+
+PAGE_SIZE = 50
+
+
+def canned_outputs(now):
+    '''
+    Return the output and exit status of every remote fact, first for an
+    instance that passes all tests and then for one that does not.
+    '''
+    good = {
+        'puppet_conf': ('[main]\nlogdir = /var/log/puppet\n\n[agent]\nserver = virt0.wikimedia.org\n', 0),
+        'puppet_last_run_summary': ('time:\n  last_run: %d\n' % (now - 3600), 0),
+        'home_listing': ('', 0),
+        'df_home': ('Filesystem 1K-blocks Used Available Use% Mounted on\n'
+                    'projects-nfs.pmtpa.wmnet:/home 104857600 1048576 103809024 1% /home', 0),
+        'mysql_init_scripts': ('ls: cannot access /etc/init.d/mysql*: No such file or directory', 2),
+        'mysql_status': ('', 0),
+        'mysql_databases': ('', 0),
+        'mediawiki_folder': ('', 1),
+        'lsb_release': ('12.04', 0),
+    }
+    bad = {
+        'puppet_conf': ('[main]\nlogdir = /var/log/puppet\n\n[agent]\nserver = i-000001.pmtpa.wmflabs\n', 0),
+        'puppet_last_run_summary': ('time:\n  last_run: %d\n' % (now - 5 * 86400), 0),
+        'home_listing': ('backup.tar.gz\ndata\nnotes.txt', 0),
+        'df_home': ('Filesystem 1K-blocks Used Available Use% Mounted on\n'
+                    '/dev/vda1 10321208 2965996 6831092 31% /', 0),
+        'mysql_init_scripts': ('/etc/init.d/mysql', 0),
+        'mysql_status': ('mysql start/running, process 1042', 0),
+        'mysql_databases': ('Database\ninformation_schema\nmysql\nwiki', 0),
+        'mediawiki_folder': ('', 0),
+        'lsb_release': ('10.04', 0),
+    }
+    return good, bad
+
+
+class FakeExecutor:
+
+    def __init__(self, connect_latency=0.05, command_latency=0.2, failure_rate=0.02,
+                 problem_rate=0.1, seed=0, slow_rate=0.0, slow_latency=2.0):
+        self.connect_latency = connect_latency
+        self.command_latency = command_latency
+        self.failure_rate = failure_rate
+        self.problem_rate = problem_rate
+        self.seed = seed
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+
+    def random(self, host_string, purpose):
+        return random.Random('%s:%s:%s' % (self.seed, host_string, purpose))
+
+    def connect(self, host_string):
+        stats = connection.ConnectStats()
+        stats.attempts = 1
+        time.sleep(self.connect_latency)
+        stats.elapsed = self.connect_latency
+        if self.random(host_string, 'connect').random() < self.failure_rate:
+            stats.error = SystemExit('Simulated connection failure')
+        return stats
+
+    def run(self, commands):
+        '''
+        Return what the payload for the given (name, command, as_root, guard)
+        tuples would have printed on the current host.
+        '''
+        now = time.time()
+        good, bad = canned_outputs(now)
+        canned = bad if self.random(env.host_string, 'outputs').random() < self.problem_rate else good
+        time.sleep(self.command_latency)
+        if self.random(env.host_string, 'slow').random() < self.slow_rate:
+            time.sleep(self.slow_latency)
+        lines = []
+        statuses = {}
+        step = self.command_latency / max(len(commands), 1)
+        for position, (name, command, as_root, guard) in enumerate(commands):
+            if guard is not None and statuses.get(guard) != 0:
+                lines.append('%s skip %s' % (probe.MARKER, name))
+                continue
+            output, status = canned.get(name, ('', 0))
+            statuses[name] = status
+            started = now + position * step
+            lines.append('%s begin %s %.6f' % (probe.MARKER, name, started))
+            if output:
+                lines.append(output)
+            lines.append('%s end %s %d %.6f' % (probe.MARKER, name, status, started + step))
+        return '\n'.join(lines)
+
+
+def instances(count, projects):
+    '''
+    Return the names of the simulated instances by project.
+    '''
+    result = dict(('project%03d' % project, []) for project in range(projects))
+    for number in range(count):
+        result['project%03d' % (number % projects)].append('sim-%06d' % number)
+    return result
+
+
+class FakeWikitech(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, projects, latency=0.0):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), AskHandler)
+        self.projects = projects
+        self.latency = latency
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d/w/api.php' % self.server_address[1]
+
+    def ask(self, query):
+        offset = re.search(r'\|offset=(\d+)', query)
+        offset = int(offset.group(1)) if offset else 0
+        member = re.search(r'\[\[Member::User:([^\]]+)\]\]', query)
+        project = re.search(r'\[\[Project::([^\]]+)\]\]', query)
+        if member:
+            items = [('Nova Resource:%s' % name, {'printouts': []})
+                     for name in sorted(self.projects)]
+        elif project:
+            name = project.group(1)
+            items = [('Nova Resource:i-%s.pmtpa.wmflabs' % instance,
+                      {'printouts': {'Instance Name': [instance], 'Project': [name]}})
+                     for instance in self.projects.get(name, [])]
+        else:
+            items = []
+        page = items[offset:offset + PAGE_SIZE]
+        doc = {'query': {'results': dict(page), 'meta': {'count': len(page), 'offset': offset}}}
+        if offset + PAGE_SIZE < len(items):
+            doc['query-continue-offset'] = offset + PAGE_SIZE
+        return doc
+
+
+class AskHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        params = urlparse.parse_qs(urlparse.urlparse(self.path).query)
+        time.sleep(self.server.latency)
+        if params.get('action') != ['ask'] or 'query' not in params:
+            self.send_error(400)
+            return
+        body = json.dumps(self.server.ask(params['query'][0]))
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start():
+    '''
+    Start the fake Wikitech and configure env to use it and the FakeExecutor.
+    '''
+    count = config.get_int('simulate_instances', 10)
+    projects = config.get_int('simulate_projects', 0) or max(count / 50, 1)
+    server = FakeWikitech(instances(count, projects),
+                          config.get_float('simulate_api_latency', 0.0))
+    thread = threading.Thread(target=server.serve_forever, name='fake-wikitech')
+    thread.daemon = True
+    thread.start()
+    env.api_url = server.url
+    env.refresh_inventory = True
+    env.multiplex = False
+    if not env.get('cache_dir'):
+        env.cache_dir = tempfile.mkdtemp(prefix='labs-migration-assistant-simulation-')
+        atexit.register(shutil.rmtree, env.cache_dir, True)
+    env.executor = FakeExecutor(config.get_float('simulate_connect_latency', 0.05),
+                                config.get_float('simulate_command_latency', 0.2),
+                                config.get_float('simulate_failure_rate', 0.02),
+                                config.get_float('simulate_problem_rate', 0.1),
+                                config.get_str('simulate_seed', '0'),
+                                config.get_float('simulate_slow_rate', 0.0),
+                                config.get_float('simulate_slow_latency', 2.0))
+    logging.info('Simulating %d instances in %d projects, fake Wikitech at %s' %
+                 (count, projects, server.url))
+    return server
@@ -0,0 +1,93 @@
+import os
+import logging
+import unittest
+
+from fabric.api import env
+
+import asynclog
+
+from ansistrm import ColorizingStreamHandler
+
+
+class Stream(object):
+
+    def __init__(self):
+        self.writes = []
+        self.flushes = 0
+
+    def write(self, data):
+        self.writes.append(data)
+
+    def flush(self):
+        self.flushes += 1
+
+
+class AsyncHandlerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.stream = Stream()
+        target = ColorizingStreamHandler(self.stream)
+        target.setFormatter(asynclog.HostFormatter('%(host)s %(levelname)s %(message)s'))
+        self.handler = asynclog.AsyncHandler(target, batch_size=100, interval=0.2)
+        self.logger = logging.Logger('test_asynclog')
+        self.logger.addHandler(self.handler)
+
+    def tearDown(self):
+        self.handler.close()
+        env.host_string = None
+
+    def test_batches(self):
+        for number in range(250):
+            self.logger.info('line %d', number)
+        self.handler.flush()
+        output = ''.join(self.stream.writes)
+        self.assertEqual(output.splitlines(), ['local INFO line %d' % number for number in range(250)])
+        self.assertTrue(len(self.stream.writes) < 10)
+        self.assertEqual(self.stream.flushes, len(self.stream.writes))
+
+    def test_host_and_arguments(self):
+        env.host_string = 'web1.pmtpa.wmflabs'
+        values = ['before']
+        self.logger.info('output:\n%s', values)
+        values[0] = 'after'
+        env.host_string = None
+        self.handler.flush()
+        self.assertEqual(''.join(self.stream.writes),
+                         "web1.pmtpa.wmflabs INFO output:\nweb1.pmtpa.wmflabs | ['before']\n")
+
+    def test_exception(self):
+        try:
+            raise ValueError('broken')
+        except ValueError:
+            self.logger.exception('failed')
+        self.handler.flush()
+        output = ''.join(self.stream.writes)
+        self.assertTrue(output.startswith('local ERROR failed\nlocal | Traceback'))
+        self.assertTrue('ValueError: broken' in output)
+
+    def test_close_writes_everything(self):
+        self.logger.info('last words')
+        self.handler.close()
+        self.assertFalse(self.handler.thread.is_alive())
+        self.assertEqual(''.join(self.stream.writes), 'local INFO last words\n')
+
+    def test_forked_process(self):
+        read_end, write_end = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                self.stream.writes = []
+                self.logger.info('from the child')
+                self.handler.flush()
+                os.write(write_end, ''.join(self.stream.writes))
+            finally:
+                os._exit(0)
+        os.close(write_end)
+        os.waitpid(pid, 0)
+        output = os.read(read_end, 4096)
+        os.close(read_end)
+        self.assertEqual(output, 'local INFO from the child\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from fabric.api import env
+
+import cache
+
+
+class CachePathTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        env.cache_dir = self.directory
+
+    def tearDown(self):
+        del env['cache_dir']
+        shutil.rmtree(self.directory)
+
+    def test_ascii_username(self):
+        self.assertEqual(cache.cache_path('results', 'alice'),
+                         os.path.join(self.directory, 'results-alice.json'))
+
+    def test_non_ascii_username_from_command_line(self):
+        # --set gives byte strings
+        self.assertEqual(cache.cache_path('results', 'J\xc3\xb6rg'),
+                         os.path.join(self.directory, 'results-J%C3%B6rg.json'))
+
+    def test_non_ascii_username_as_unicode(self):
+        self.assertEqual(cache.cache_path('checkpoint', u'J\xf6rg', 'jsonl'),
+                         os.path.join(self.directory, 'checkpoint-J%C3%B6rg.jsonl'))
+
+    def test_write_and_read(self):
+        path = cache.cache_path('results', 'J\xc3\xb6rg')
+        cache.write_cache(path, {'hosts': 1})
+        self.assertEqual(cache.read_cache(path), {'hosts': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import shutil
+import tempfile
+import unittest
+
+from fabric.api import env
+
+import checks
+import fabfile
+
+from checks import PASS
+from checkpoint import Checkpoint
+from labinstance import LabInstance
+
+
+class CheckpointTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        env.cache_dir = self.directory
+
+    def tearDown(self):
+        del env['cache_dir']
+        shutil.rmtree(self.directory)
+
+    def test_write_and_load(self):
+        checkpoint = Checkpoint('alice')
+        checkpoint.start()
+        checkpoint.write({'host': 'web1', 'errors': 1}, {'check_puppet': 'output'})
+        checkpoint.write({'host': 'web2', 'errors': 0}, None)
+        checkpoint.write({'host': 'web1', 'errors': 0}, None)
+        self.assertEqual(Checkpoint('alice').load(), {
+            'web1': {'host': 'web1', 'errors': 0, 'outputs': {}},
+            'web2': {'host': 'web2', 'errors': 0, 'outputs': {}},
+        })
+
+    def test_interrupted_write(self):
+        checkpoint = Checkpoint('alice')
+        checkpoint.start()
+        checkpoint.write({'host': 'web1'}, None)
+        with open(checkpoint.path, 'a') as fh:
+            fh.write('{"host": "we')
+        self.assertEqual(checkpoint.load(), {'web1': {'host': 'web1', 'outputs': {}}})
+
+    def test_start_truncates(self):
+        checkpoint = Checkpoint('alice')
+        checkpoint.write({'host': 'web1'}, None)
+        checkpoint.start()
+        self.assertEqual(checkpoint.load(), {})
+
+    def test_no_checkpoint(self):
+        self.assertEqual(Checkpoint('alice').load(), {})
+
+
+class ResumeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        env.cache_dir = self.directory
+        self.tasks = checks.names()[:2]
+        env.labinstances = {}
+        for name in ('web1', 'web2'):
+            labinstance = LabInstance(name, 'www', 'pmtpa')
+            env.labinstances[str(labinstance)] = labinstance
+
+    def tearDown(self):
+        for key in ('cache_dir', 'labinstances'):
+            env.pop(key, None)
+        shutil.rmtree(self.directory)
+
+    def test_resume_reused_hosts(self):
+        checkpoint = Checkpoint('alice')
+        checkpoint.start()
+        # web1 was skipped by an incremental run that got interrupted
+        reused = env.labinstances['web1.pmtpa.wmflabs']
+        for task in self.tasks:
+            reused.reuse(task, PASS)
+        reused.connect = True
+        fabfile.checkpoint_hosts(checkpoint, ['web1.pmtpa.wmflabs'], self.tasks)
+        env.labinstances['web1.pmtpa.wmflabs'] = LabInstance('web1', 'www', 'pmtpa')
+        remaining = fabfile.resume_audit(checkpoint.load(), sorted(env.labinstances), self.tasks)
+        self.assertEqual(remaining, ['web2.pmtpa.wmflabs'])
+        restored = env.labinstances['web1.pmtpa.wmflabs']
+        self.assertTrue(restored.connect)
+        self.assertEqual([restored.is_reused(task) for task in self.tasks], [True, True])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,199 @@
+import time
+import logging
+import unittest
+
+import checks
+
+from checks import PASS, WARNING, FAIL, Check, FactSet
+from probe import CommandResult
+
+
+def results(**outputs):
+    '''
+    Build the results of a probe from (output, status) tuples, None for a
+    command that was skipped because of its guard.
+    '''
+    return dict((name, CommandResult(None, None, None) if value is None else
+                 CommandResult(value[0], value[1], 0.5))
+                for name, value in outputs.iteritems())
+
+
+class PlanTest(unittest.TestCase):
+
+    def test_guards_come_first(self):
+        names = [fact.name for fact in checks.plan([checks.get_check('detect_databases')])]
+        self.assertEqual(names[0], 'mysql_init_scripts')
+        self.assertEqual(sorted(names[1:]), ['mysql_databases', 'mysql_status'])
+
+    def test_shared_commands_run_once(self):
+        names = [fact.name for fact in checks.plan(checks.registry)]
+        self.assertEqual(len(names), len(set(names)))
+        self.assertEqual(sorted(names), sorted(name for name, fact in checks.facts.iteritems()
+                                               if fact.is_remote()))
+
+    def test_remote_commands(self):
+        self.assertEqual(checks.remote_commands([checks.get_check('detect_databases')])[1:2],
+                         [('mysql_status', 'service mysql status', False, 'mysql_init_scripts')])
+        self.assertEqual(checks.remote_commands([checks.get_check('detect_last_puppet_run')]),
+                         [('puppet_last_run_summary', 'cat /var/lib/puppet/state/last_run_summary.yaml',
+                           True, None)])
+
+    def test_check_remote_facts(self):
+        self.assertEqual(checks.get_check('check_ubuntu').remote_facts(), ['lsb_release'])
+
+
+class RegistrationTest(unittest.TestCase):
+
+    def test_invalid_fact_name(self):
+        self.assertRaises(ValueError, checks.remote_fact, 'not-a-variable', 'true')
+
+    def test_guard_has_to_be_remote(self):
+        self.assertRaises(ValueError, checks.remote_fact, 'test_guarded', 'true', when='ubuntu_version')
+
+    def test_unknown_fact(self):
+        self.assertRaises(ValueError, checks.fact('no_such_fact'), lambda facts: None)
+        self.assertRaises(ValueError, checks.check('no_such_fact'), lambda facts: PASS)
+
+    def test_duplicate_test(self):
+        def check_ubuntu(facts):
+            return PASS
+        self.assertRaises(ValueError, checks.check('ubuntu_version'), check_ubuntu)
+
+
+class FactSetTest(unittest.TestCase):
+
+    def test_remote_and_derived_facts(self):
+        calls = []
+
+        def home_file_count(facts):
+            calls.append(True)
+            return len(facts['home_files'])
+        checks.facts['test_home_file_count'] = checks.Fact('test_home_file_count', needs=('home_files',),
+                                                           compute=home_file_count)
+        try:
+            factset = FactSet(results(home_listing=('a\nb\n', 0)))
+            self.assertEqual(factset['home_listing'], 'a\nb\n')
+            self.assertEqual(factset['test_home_file_count'], 2)
+            self.assertEqual(factset['test_home_file_count'], 2)
+            self.assertEqual(len(calls), 1)
+            self.assertEqual(factset.status('home_listing'), 0)
+        finally:
+            del checks.facts['test_home_file_count']
+
+    def test_skipped_command(self):
+        factset = FactSet(results(mysql_init_scripts=('', 2), mysql_status=None))
+        self.assertEqual(factset['mysql_status'], None)
+        self.assertEqual(factset.status('mysql_status'), None)
+
+    def test_missing_command(self):
+        factset = FactSet(results())
+        self.assertRaises(checks.MissingFact, factset.__getitem__, 'home_listing')
+        self.assertRaises(checks.MissingFact, factset.status, 'home_listing')
+
+
+class CheckTest(unittest.TestCase):
+
+    def setUp(self):
+        logging.disable(logging.ERROR)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_missing_fact_fails(self):
+        check = checks.get_check('check_ubuntu')
+        self.assertEqual(check.run(FactSet(results())), FAIL)
+
+    def test_uninterpretable_output_fails(self):
+        check = Check('test_broken', ('home_listing',), lambda facts: int(facts['home_listing']))
+        self.assertEqual(check.run(FactSet(results(home_listing=('a\n', 0)))), FAIL)
+
+    def test_outputs_and_duration(self):
+        check = checks.get_check('detect_databases')
+        probe_results = results(mysql_init_scripts=('/etc/init.d/mysql', 0),
+                                mysql_status=('mysql start/running', 0), lsb_release=('12.04', 0))
+        self.assertEqual(check.outputs(probe_results), {'mysql_init_scripts': '/etc/init.d/mysql',
+                                                        'mysql_status': 'mysql start/running'})
+        self.assertEqual(check.duration(probe_results), 1.0)
+
+
+DF_HEADER = 'Filesystem 1K-blocks Used Available Use% Mounted on\n'
+
+
+class EvaluateTest(unittest.TestCase):
+    '''
+    Run every test against canned output of its commands.
+    '''
+
+    def setUp(self):
+        logging.disable(logging.ERROR)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def evaluate(self, name, **outputs):
+        return checks.get_check(name).run(FactSet(results(**outputs)))
+
+    def test_self_puppetmaster(self):
+        default = '[main]\nlogdir = /var/log/puppet\n[agent]\nserver = virt0.wikimedia.org\n'
+        own = '[agent]\nserver = i-000001.pmtpa.wmflabs\n'
+        commented = '[agent]\n# server = i-000001.pmtpa.wmflabs\nserver = virt0.wikimedia.org\n'
+        self.assertEqual(self.evaluate('detect_self_puppetmaster', puppet_conf=(default, 0)), PASS)
+        self.assertEqual(self.evaluate('detect_self_puppetmaster', puppet_conf=(own, 0)), FAIL)
+        self.assertEqual(self.evaluate('detect_self_puppetmaster', puppet_conf=(commented, 0)), PASS)
+        self.assertEqual(self.evaluate('detect_self_puppetmaster', puppet_conf=(default + own, 0)), FAIL)
+        self.assertEqual(self.evaluate('detect_self_puppetmaster', puppet_conf=('[main]\n', 0)), PASS)
+        self.assertEqual(self.evaluate('detect_self_puppetmaster',
+                                       puppet_conf=('cat: /etc/puppet/puppet.conf: No such file', 1)), FAIL)
+
+    def test_last_puppet_run(self):
+        summary = 'time:\n  total: 12.3\n  last_run: %d\n'
+        self.assertEqual(self.evaluate('detect_last_puppet_run',
+                                       puppet_last_run_summary=(summary % (time.time() - 3600), 0)), PASS)
+        self.assertEqual(self.evaluate('detect_last_puppet_run',
+                                       puppet_last_run_summary=(summary % (time.time() - 2 * 86400), 0)), FAIL)
+        self.assertEqual(self.evaluate('detect_last_puppet_run',
+                                       puppet_last_run_summary=('cat: No such file or directory', 1)), FAIL)
+
+    def test_shared_storage_for_projects(self):
+        self.assertEqual(self.evaluate('detect_shared_storage_for_projects', home_listing=('', 0)), PASS)
+        self.assertEqual(self.evaluate('detect_shared_storage_for_projects',
+                                       home_listing=('backup.tar.gz\ndata\n', 0)), FAIL)
+
+    def test_shared_storage_for_home(self):
+        self.assertEqual(self.evaluate('detect_shared_storage_for_home',
+                                       df_home=(DF_HEADER + 'projects-nfs.pmtpa.wmnet:/home 1 1 1 1% /home', 0)),
+                         PASS)
+        self.assertEqual(self.evaluate('detect_shared_storage_for_home',
+                                       df_home=(DF_HEADER + '/dev/vda1 1 1 1 1% /', 0)), FAIL)
+        self.assertEqual(self.evaluate('detect_shared_storage_for_home',
+                                       df_home=('df: /home: No such file or directory', 1)), FAIL)
+
+    def test_databases(self):
+        databases = 'Database\ninformation_schema\nmysql\nperformance_schema\n'
+        running = dict(mysql_init_scripts=('/etc/init.d/mysql', 0),
+                       mysql_status=('mysql start/running, process 1234', 0))
+        self.assertEqual(self.evaluate('detect_databases', mysql_init_scripts=('', 2),
+                                       mysql_status=None, mysql_databases=None), PASS)
+        self.assertEqual(self.evaluate('detect_databases', mysql_init_scripts=('/etc/init.d/mysql', 0),
+                                       mysql_status=('mysql stop/waiting', 0),
+                                       mysql_databases=('', 1)), WARNING)
+        self.assertEqual(self.evaluate('detect_databases', mysql_databases=(databases, 0), **running),
+                         PASS)
+        self.assertEqual(self.evaluate('detect_databases', mysql_databases=(databases + 'wiki\n', 0),
+                                       **running), WARNING)
+        self.assertEqual(self.evaluate('detect_databases', mysql_databases=('ERROR 1045 (28000)', 1),
+                                       **running), WARNING)
+
+    def test_mediawiki(self):
+        self.assertEqual(self.evaluate('detect_mediawiki', mediawiki_folder=('', 0)), WARNING)
+        self.assertEqual(self.evaluate('detect_mediawiki', mediawiki_folder=('', 1)), PASS)
+
+    def test_ubuntu(self):
+        self.assertEqual(self.evaluate('check_ubuntu', lsb_release=('12.04\n', 0)), PASS)
+        self.assertEqual(self.evaluate('check_ubuntu', lsb_release=('10.04\n', 0)), WARNING)
+        self.assertEqual(self.evaluate('check_ubuntu', lsb_release=('n/a\n', 0)), WARNING)
+        self.assertEqual(self.evaluate('check_ubuntu', lsb_release=('', 127)), WARNING)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import unittest
+
+from fabric.api import env
+
+import concurrency
+
+from concurrency import Controller
+
+
+class Instance:
+
+    def __init__(self, connect_time=0.5, attempts=1, timeouts=0):
+        self.connect = connect_time is not None
+        self.connect_time = connect_time
+        self.attempts = attempts
+        self.timeouts = timeouts
+
+
+def batch(size, **kwargs):
+    return [Instance(**kwargs) for _ in range(size)]
+
+
+class ControllerTest(unittest.TestCase):
+
+    def test_limits(self):
+        controller = Controller(initial=100, minimum=0, maximum=16)
+        self.assertEqual((controller.workers, controller.minimum, controller.maximum), (16, 1, 16))
+        self.assertEqual(Controller(initial=1, minimum=4).workers, 4)
+
+    def test_grows_while_healthy(self):
+        controller = Controller(initial=8, maximum=14, step=4)
+        self.assertEqual(controller.update(batch(8)), 12)
+        self.assertEqual(controller.update(batch(12)), 14)
+        self.assertEqual(controller.update(batch(14)), 14)
+
+    def test_keeps_workers_when_pool_was_not_full(self):
+        controller = Controller(initial=8)
+        self.assertEqual(controller.update(batch(5)), 8)
+
+    def test_timeouts(self):
+        controller = Controller(initial=16, minimum=6, max_timeout_rate=0.1)
+        healthy, reason = controller.assess(batch(9) + batch(1, attempts=2, timeouts=1))
+        self.assertEqual(healthy, True)
+        healthy, reason = controller.assess(batch(8) + batch(2, attempts=2, timeouts=1))
+        self.assertEqual((healthy, reason), (False, '2 of 12 connection attempts timed out'))
+        self.assertEqual(controller.update(batch(16, attempts=3, timeouts=2)), 8)
+        self.assertEqual(controller.update(batch(16, attempts=3, timeouts=2)), 6)
+
+    def test_slow_connections(self):
+        controller = Controller(initial=16, max_connect_time=5.0)
+        self.assertEqual(controller.update(batch(16, connect_time=6.0)), 8)
+
+    def test_slowdown(self):
+        controller = Controller(initial=16, maximum=16, slowdown=3.0)
+        self.assertEqual(controller.update(batch(16, connect_time=0.5)), 16)
+        self.assertEqual(controller.baseline, 0.5)
+        # small connect times are noise
+        self.assertEqual(controller.update(batch(16, connect_time=0.9)), 16)
+        self.assertEqual(controller.update(batch(16, connect_time=1.6)), 8)
+        self.assertEqual(controller.baseline, 0.5)
+
+    def test_nothing_to_go_by(self):
+        controller = Controller(initial=8)
+        self.assertEqual(controller.assess([])[0], None)
+        self.assertEqual(controller.assess(batch(8, connect_time=None))[0], None)
+        self.assertEqual(controller.update(batch(8, attempts=0)), 8)
+
+
+class FromEnvTest(unittest.TestCase):
+
+    def tearDown(self):
+        for key in ('workers', 'max_workers'):
+            env.pop(key, None)
+
+    def test_fixed_workers(self):
+        env.workers = '16'
+        self.assertEqual(concurrency.from_env(), None)
+
+    def test_auto(self):
+        env.workers = 'auto'
+        env.max_workers = '32'
+        controller = concurrency.from_env()
+        self.assertEqual((controller.workers, controller.maximum), (8, 32))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+import time
+import signal
+import unittest
+
+import connection
+
+
+class DeadlineTest(unittest.TestCase):
+
+    def test_expired(self):
+        start = time.time()
+        try:
+            with connection.deadline(0.1):
+                time.sleep(5)
+        except connection.HostTimeout:
+            pass
+        else:
+            self.fail('HostTimeout was not raised')
+        self.assertTrue(time.time() - start < 1)
+
+    def test_finished_in_time(self):
+        with connection.deadline(1):
+            pass
+        # the alarm has been cancelled
+        time.sleep(1.2)
+
+    def test_no_deadline(self):
+        with connection.deadline(0):
+            time.sleep(0.01)
+
+    def test_restores_handler(self):
+        previous = signal.getsignal(signal.SIGALRM)
+        with connection.deadline(1):
+            self.assertNotEqual(signal.getsignal(signal.SIGALRM), previous)
+        self.assertEqual(signal.getsignal(signal.SIGALRM), previous)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import logging
+import unittest
+
+import dashboard
+
+
+TASKS = ['check_puppet', 'check_ubuntu']
+
+
+def record(host, results=None, project='www', connect=True):
+    if results is None:
+        results = dict((task, 'PASS' if connect else 'FAIL') for task in TASKS)
+    return {
+        'host': host,
+        'project': project,
+        'connect': connect,
+        'timed_out': False,
+        'errors': results.values().count('FAIL'),
+        'warnings': results.values().count('WARNING'),
+        'results': results,
+        'reused': [],
+    }
+
+
+class DashboardTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dashboard = dashboard.Dashboard(TASKS, worst=2)
+        for item in (record('web1'),
+                     record('web2', {'check_puppet': 'FAIL', 'check_ubuntu': 'WARNING'}),
+                     record('web3', {'check_puppet': 'PASS', 'check_ubuntu': 'WARNING'}),
+                     record('kafka1', project='analytics', connect=False),
+                     record('kafka2', {'check_puppet': 'FAIL', 'check_ubuntu': 'PASS'},
+                            project='analytics')):
+            self.dashboard.add(item)
+
+    def test_projects(self):
+        self.assertEqual(self.dashboard.hosts, 5)
+        self.assertEqual(self.dashboard.projects, {
+            'www': {'hosts': 3, 'ready': 1, 'failed': 1, 'warnings': 1, 'unreachable': 0},
+            'analytics': {'hosts': 2, 'ready': 0, 'failed': 1, 'warnings': 0, 'unreachable': 1}})
+
+    def test_checks_skip_unreachable_instances(self):
+        self.assertEqual(self.dashboard.checks, {
+            'check_puppet': {'PASS': 2, 'WARNING': 0, 'FAIL': 2},
+            'check_ubuntu': {'PASS': 2, 'WARNING': 2, 'FAIL': 0}})
+
+    def test_worst_offenders(self):
+        # kafka1 failed all tests because it could not be reached, that is
+        # one problem and not two
+        self.assertEqual(sorted(self.dashboard.offenders, reverse=True),
+                         [(2, 'web2', False), (1, 'web3', False)])
+
+    def test_output(self):
+        messages = []
+
+        class Collector(logging.Handler):
+            def emit(self, record):
+                messages.append(record.getMessage())
+        handler = Collector()
+        logger = logging.getLogger()
+        logger.addHandler(handler)
+        level = logger.level
+        logger.setLevel(logging.INFO)
+        try:
+            self.dashboard.worst = 10
+            self.dashboard.add(record('kafka3', project='analytics', connect=False))
+            self.dashboard.output()
+        finally:
+            logger.removeHandler(handler)
+            logger.setLevel(level)
+        self.assertEqual(messages[0], '***** Dashboard of 6 instances *****')
+        self.assertTrue('%-40s unreachable' % 'kafka3' in messages)
+        self.assertTrue('%-40s 2 problems' % 'web2' in messages)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import unittest
+
+import history
+
+from checks import PASS, WARNING, FAIL
+
+
+TASKS = ['check_puppet', 'check_ubuntu']
+
+
+def record(host, results=None, project='www', connect=True, connect_time=0.5, command_time=1.0):
+    if results is None:
+        # the tests of an instance that could not be reached failed
+        results = dict((task, 'PASS' if connect else 'FAIL') for task in TASKS)
+    return {
+        'host': host,
+        'project': project,
+        'datacenter': 'pmtpa',
+        'connect': connect,
+        'timed_out': False,
+        'errors': results.values().count('FAIL'),
+        'warnings': results.values().count('WARNING'),
+        'connect_time': connect_time if connect else None,
+        'command_time': command_time if connect else None,
+        'attempts': 1,
+        'timeouts': int(not connect),
+        'results': results,
+        'reused': [],
+        'durations': dict((task, 0.5) for task in results),
+        'checked': {},
+    }
+
+
+class HistoryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.history = history.History(':memory:')
+
+    def tearDown(self):
+        self.history.close()
+
+    def test_runs(self):
+        self.history.record([record('web1'), record('web2')], TASKS, 100.0)
+        self.history.record([record('web1', {'check_puppet': 'FAIL', 'check_ubuntu': 'PASS'}),
+                             record('web2', connect=False)], TASKS, 200.0, 'shard-1-of-2')
+        runs = self.history.runs()
+        self.assertEqual([(run_id, shard, hosts, unreachable, failed)
+                          for run_id, started, finished, shard, hosts, unreachable, failed in runs],
+                         [(1, None, 2, 0, 0), (2, 'shard-1-of-2', 2, 1, 1)])
+        self.assertEqual([run[0] for run in self.history.runs(limit=1)], [2])
+
+    def test_regressions(self):
+        self.history.record([record('web1'), record('web2'), record('web3')], TASKS, 100.0)
+        self.history.record([record('web1', {'check_puppet': 'WARNING', 'check_ubuntu': 'PASS'}),
+                             record('web3', connect=False)], TASKS, 200.0)
+        self.history.record([record('web2', {'check_puppet': 'PASS', 'check_ubuntu': 'FAIL'})],
+                            TASKS, 300.0)
+        self.assertEqual(self.history.regressions(), [
+            ('web1', 'check_puppet', PASS, WARNING),
+            ('web2', 'check_ubuntu', PASS, FAIL)])
+        self.assertEqual(self.history.newly_unreachable(), ['web3'])
+
+    def test_regressions_skip_runs_without_the_test(self):
+        self.history.record([record('web1', {'check_puppet': 'PASS'})], ['check_puppet'], 100.0)
+        self.history.record([record('web1', {'check_ubuntu': 'FAIL'})], ['check_ubuntu'], 200.0)
+        self.history.record([record('web1', {'check_puppet': 'FAIL'})], ['check_puppet'], 300.0)
+        self.assertEqual(self.history.regressions(), [('web1', 'check_puppet', PASS, FAIL)])
+
+    def test_recovered(self):
+        self.history.record([record('web1', {'check_puppet': 'FAIL', 'check_ubuntu': 'PASS'}),
+                             record('web2', connect=False)], TASKS, 100.0)
+        self.history.record([record('web1'), record('web2')], TASKS, 200.0)
+        self.assertEqual(self.history.regressions(), [])
+        self.assertEqual(self.history.newly_unreachable(), [])
+
+    def test_project_times(self):
+        self.history.record([record('web1', connect_time=1.0, command_time=2.0),
+                             record('web2', connect_time=3.0, command_time=4.0),
+                             record('kafka1', project='analytics', connect_time=0.5),
+                             record('kafka2', project='analytics', connect=False)], TASKS, 100.0)
+        self.assertEqual(self.history.project_times(), [('www', 2, 2.0, 3.0),
+                                                        ('analytics', 1, 0.5, 1.0)])
+
+    def test_failing_tests(self):
+        self.history.record([record('web1', {'check_puppet': 'FAIL', 'check_ubuntu': 'WARNING'}),
+                             record('web2', {'check_puppet': 'FAIL', 'check_ubuntu': 'PASS'})],
+                            TASKS, 100.0)
+        self.history.record([record('web1', {'check_puppet': 'PASS', 'check_ubuntu': 'FAIL'})],
+                            TASKS, 200.0)
+        self.assertEqual(self.history.failing_tests(), [('check_puppet', 3, 2, 0),
+                                                        ('check_ubuntu', 3, 1, 1)])
+        self.assertEqual(self.history.failing_tests(limit=1), [('check_ubuntu', 1, 1, 0),
+                                                               ('check_puppet', 1, 0, 0)])
+
+    def test_unknown_query(self):
+        self.assertRaises(ValueError, self.history.output, 'hosts')
+
+
+if __name__ == '__main__':
+    unittest.main()
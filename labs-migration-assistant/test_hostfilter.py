@@ -0,0 +1,133 @@
+import os
+import tempfile
+import unittest
+
+from fabric.api import env
+
+import hostfilter
+
+from hostfilter import HostFilter
+
+
+class NameRulesTest(unittest.TestCase):
+
+    def test_rules(self):
+        rules = hostfilter.NameRules(['db1', 'web-*', 're:^cache[0-9]+$'])
+        self.assertEqual(len(rules), 2)
+        self.assertTrue(rules.matches('db1'))
+        self.assertFalse(rules.matches('db10'))
+        self.assertTrue(rules.matches('web-01'))
+        self.assertTrue(rules.matches('cache12'))
+        self.assertFalse(rules.matches('cache12a'))
+
+    def test_invalid_pattern(self):
+        self.assertRaises(ValueError, hostfilter.NameRules, ['re:(db'])
+
+
+class HostFilterTest(unittest.TestCase):
+
+    def test_include(self):
+        host_filter = HostFilter(include=['web-*', 'db1'])
+        self.assertTrue(host_filter.matches('web-01', 'www', 'pmtpa'))
+        self.assertTrue(host_filter.matches('db1', 'www', 'pmtpa'))
+        self.assertFalse(host_filter.matches('db2', 'www', 'pmtpa'))
+
+    def test_exclude(self):
+        host_filter = HostFilter(include=['web-*'], exclude=['web-test'])
+        self.assertTrue(host_filter.matches('web-01', 'www', 'pmtpa'))
+        self.assertFalse(host_filter.matches('web-test', 'www', 'pmtpa'))
+
+    def test_always_excluded(self):
+        host_filter = HostFilter()
+        self.assertTrue(host_filter.matches('web-01', 'www', 'pmtpa'))
+        self.assertFalse(host_filter.matches('tools-login', 'tools', 'pmtpa'))
+        self.assertFalse(host_filter.matches('bastion1', 'bastion', 'pmtpa'))
+
+    def test_projects_and_datacenters(self):
+        host_filter = HostFilter(projects=['analytics'], datacenters=['pmtpa'])
+        self.assertTrue(host_filter.matches('kafka1', 'analytics', 'pmtpa'))
+        self.assertTrue(host_filter.matches('kafka1', 'www, analytics', 'pmtpa'))
+        self.assertFalse(host_filter.matches('kafka1', 'analytics', 'eqiad'))
+        self.assertFalse(host_filter.matches('kafka1', 'www', 'pmtpa'))
+        self.assertFalse(host_filter.matches('kafka1', None, 'pmtpa'))
+
+
+class ShardTest(unittest.TestCase):
+
+    names = ['instance-%d' % number for number in range(1000)]
+
+    def test_every_instance_in_one_shard(self):
+        shards = [hostfilter.Shard(index, 4) for index in range(1, 5)]
+        for name in self.names:
+            self.assertEqual(len([shard for shard in shards if shard.contains(name)]), 1)
+
+    def test_balanced(self):
+        shards = [hostfilter.Shard(index, 4) for index in range(1, 5)]
+        for shard in shards:
+            self.assertTrue(200 < len(filter(shard.contains, self.names)) < 300)
+
+    def test_non_ascii_names(self):
+        shard = hostfilter.Shard(2, 3)
+        self.assertEqual(shard.contains(u'j\xf6rg'), shard.contains('j\xc3\xb6rg'))
+
+    def test_filter(self):
+        shard = hostfilter.Shard(1, 2)
+        host_filter = HostFilter(shard=shard)
+        for name in self.names[:50]:
+            self.assertEqual(host_filter.matches(name, 'www', 'pmtpa'), shard.contains(name))
+
+    def test_parse_shard(self):
+        shard = hostfilter.parse_shard('2/4')
+        self.assertEqual((shard.index, shard.count), (2, 4))
+        self.assertEqual(str(shard), 'shard-2-of-4')
+        self.assertEqual(hostfilter.parse_shard(''), None)
+        for value in ('2', '2/x', '0/4', '5/4', '1/2/3'):
+            self.assertRaises(ValueError, hostfilter.parse_shard, value)
+
+
+class FromEnvTest(unittest.TestCase):
+
+    keys = ('include', 'exclude', 'projects', 'datacenters', 'filter_file')
+
+    def tearDown(self):
+        for key in self.keys:
+            env.pop(key, None)
+
+    def test_settings(self):
+        env.include = 'web-*;re:^db[0-9]+$'
+        env.exclude = 'web-test'
+        host_filter = hostfilter.from_env(ignored_hosts=['db3'])
+        self.assertTrue(host_filter.matches('web-01', 'www', 'pmtpa'))
+        self.assertTrue(host_filter.matches('db1', 'www', 'pmtpa'))
+        self.assertFalse(host_filter.matches('web-test', 'www', 'pmtpa'))
+        self.assertFalse(host_filter.matches('db3', 'www', 'pmtpa'))
+        self.assertFalse(host_filter.matches('web-01', 'www', 'eqiad'))
+
+    def test_filter_file(self):
+        fd, path = tempfile.mkstemp()
+        try:
+            os.write(fd, '# analytics only\n\nproject analytics\nexclude re:^deployment-\n'
+                         'datacenter eqiad\n')
+            os.close(fd)
+            env.filter_file = path
+            host_filter = hostfilter.from_env()
+            self.assertTrue(host_filter.matches('kafka1', 'analytics', 'eqiad'))
+            self.assertFalse(host_filter.matches('kafka1', 'analytics', 'pmtpa'))
+            self.assertFalse(host_filter.matches('deployment-db', 'analytics', 'eqiad'))
+            self.assertFalse(host_filter.matches('kafka1', 'www', 'eqiad'))
+        finally:
+            os.remove(path)
+
+    def test_invalid_filter_file(self):
+        fd, path = tempfile.mkstemp()
+        try:
+            os.write(fd, 'projects analytics\n')
+            os.close(fd)
+            env.filter_file = path
+            self.assertRaises(ValueError, hostfilter.from_env)
+        finally:
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    unittest.main()
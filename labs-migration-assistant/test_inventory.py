@@ -0,0 +1,178 @@
+import time
+import shutil
+import logging
+import tempfile
+import threading
+import unittest
+
+from fabric.api import env
+
+import inventory
+import simulation
+
+
+def slowly(items, pause):
+    for item in items:
+        time.sleep(pause)
+        yield item
+
+
+class PrefetcherTest(unittest.TestCase):
+
+    def test_takes_everything_that_is_available(self):
+        prefetcher = inventory.Prefetcher(range(1000))
+        time.sleep(0.05)
+        self.assertEqual(prefetcher.take(), range(1000))
+        self.assertEqual(prefetcher.take(), [])
+
+    def test_limit(self):
+        prefetcher = inventory.Prefetcher(range(10))
+        self.assertEqual(prefetcher.take(4), [0, 1, 2, 3])
+        self.assertEqual(prefetcher.take(4), [4, 5, 6, 7])
+        self.assertEqual(prefetcher.take(4), [8, 9])
+        self.assertEqual(prefetcher.take(4), [])
+
+    def test_stops_when_items_stop_arriving(self):
+        prefetcher = inventory.Prefetcher(slowly(range(3), 0.2))
+        self.assertEqual(prefetcher.take(idle=0.05), [0])
+        self.assertEqual(prefetcher.take(idle=0.05), [1])
+        self.assertEqual(prefetcher.take(idle=0.05), [2])
+        self.assertEqual(prefetcher.take(idle=0.05), [])
+
+    def test_failing_items(self):
+        def failing():
+            yield 1
+            raise IOError('connection reset')
+        prefetcher = inventory.Prefetcher(failing())
+        self.assertEqual(prefetcher.take(), [1])
+        self.assertEqual(prefetcher.take(), [])
+
+    def test_stop(self):
+        closed = []
+
+        def endless():
+            try:
+                number = 0
+                while True:
+                    time.sleep(0.01)
+                    yield number
+                    number += 1
+            finally:
+                closed.append(True)
+        prefetcher = inventory.Prefetcher(endless())
+        self.assertEqual(prefetcher.take(1), [0])
+        prefetcher.stop()
+        self.assertFalse(prefetcher.thread.is_alive())
+        self.assertEqual(closed, [True])
+        while prefetcher.take():
+            pass
+        self.assertTrue(prefetcher.finished)
+
+
+class BrokenWikitech(simulation.FakeWikitech):
+    '''
+    A fake Wikitech that drops the connection when asked for the instances
+    of a broken project.
+    '''
+
+    broken = ()
+
+    def ask(self, query):
+        for project in self.broken:
+            if '[[Project::%s]]' % project in query:
+                raise IOError('Simulated failure of project %s' % project)
+        return simulation.FakeWikitech.ask(self, query)
+
+    def handle_error(self, request, client_address):
+        pass
+
+
+class LoadInventoryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        env.cache_dir = self.directory
+        self.start_wikitech(simulation.instances(130, 2))
+        logging.disable(logging.ERROR)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+        self.server.shutdown()
+        self.server.server_close()
+        for key in ('cache_dir', 'api_url', 'offline', 'refresh_inventory', 'inventory_ttl'):
+            env.pop(key, None)
+        shutil.rmtree(self.directory)
+
+    def start_wikitech(self, projects, broken=()):
+        self.server = BrokenWikitech(projects)
+        self.server.broken = broken
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        env.api_url = self.server.url
+
+    def restart_wikitech(self, projects, broken=()):
+        self.server.shutdown()
+        self.server.server_close()
+        self.start_wikitech(projects, broken)
+
+    def names(self, username='alice'):
+        return sorted(name for name, project, dc in inventory.load_inventory(username))
+
+    def test_query_continuation(self):
+        # 65 instances per project do not fit on a single page
+        instances = list(inventory.load_inventory('alice'))
+        self.assertEqual(len(instances), 130)
+        self.assertEqual(sorted(name for name, project, dc in instances),
+                         ['sim-%06d' % number for number in range(130)])
+        self.assertEqual(instances[0][2], 'pmtpa')
+
+    def test_skip_failed_project(self):
+        self.restart_wikitech(simulation.instances(130, 2), broken=['project001'])
+        self.assertEqual(self.names(), ['sim-%06d' % number for number in range(0, 130, 2)])
+
+
+    def test_cache(self):
+        fetched = self.names()
+        self.restart_wikitech(simulation.instances(10, 2))
+        self.assertEqual(self.names(), fetched)
+        self.assertEqual(self.names('bob'), ['sim-%06d' % number for number in range(10)])
+        env.refresh_inventory = 'True'
+        self.assertEqual(self.names(), ['sim-%06d' % number for number in range(10)])
+
+    def test_ttl(self):
+        self.names()
+        self.restart_wikitech(simulation.instances(10, 2))
+        env.inventory_ttl = '0'
+        self.assertEqual(len(self.names()), 10)
+
+    def test_offline(self):
+        env.offline = 'True'
+        self.assertEqual(self.names(), [])
+        env.offline = 'False'
+        fetched = self.names()
+        self.restart_wikitech(simulation.instances(10, 2))
+        env.offline = 'True'
+        env.inventory_ttl = '0'
+        self.assertEqual(self.names(), fetched)
+
+    def test_fallback_to_cache(self):
+        fetched = self.names()
+        env.refresh_inventory = 'True'
+        env.api_url = 'http://127.0.0.1:1/w/api.php'
+        self.assertEqual(self.names(), fetched)
+
+    def test_cached_instances_of_failed_project(self):
+        self.names()
+        # project000 has instances 0, 2, ..., 8 now but project001 cannot be fetched
+        self.restart_wikitech(simulation.instances(10, 2), broken=['project001'])
+        env.refresh_inventory = 'True'
+        names = ['sim-%06d' % number for number in range(0, 10, 2) + range(1, 130, 2)]
+        self.assertEqual(self.names(), sorted(names))
+        # the cached instances are kept for the next run
+        env.refresh_inventory = 'False'
+        self.assertEqual(self.names(), sorted(names))
+
+
+if __name__ == '__main__':
+    unittest.main()
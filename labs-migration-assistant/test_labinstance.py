@@ -0,0 +1,51 @@
+import pickle
+import unittest
+
+import checks
+
+from checks import PASS, WARNING, FAIL
+from labinstance import LabInstance
+
+
+class LabInstanceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tasks = checks.names()
+
+    def tearDown(self):
+        LabInstance.selected = None
+
+    def test_every_test_fails_until_it_has_run(self):
+        labinstance = LabInstance('web1', 'www', 'pmtpa')
+        self.assertEqual((labinstance.errors, labinstance.warnings), (len(self.tasks), 0))
+        self.assertEqual(labinstance.result_name(self.tasks[0]), 'FAIL')
+
+    def test_counters(self):
+        labinstance = LabInstance('web1', 'www', 'pmtpa')
+        labinstance.record(self.tasks[0], PASS, 100.0, 'output', 0.5)
+        labinstance.record(self.tasks[1], WARNING, 100.0, 'output', 0.5)
+        labinstance.reuse(self.tasks[2], WARNING)
+        self.assertEqual((labinstance.errors, labinstance.warnings), (len(self.tasks) - 3, 2))
+        labinstance.set_result(self.tasks[1], FAIL)
+        self.assertEqual((labinstance.errors, labinstance.warnings), (len(self.tasks) - 2, 1))
+        self.assertTrue(labinstance.is_reused(self.tasks[2]))
+        self.assertFalse(labinstance.is_reused(self.tasks[1]))
+
+    def test_selected_tests(self):
+        LabInstance.select(self.tasks[1:3])
+        labinstance = LabInstance('web1', 'www', 'pmtpa')
+        self.assertEqual((labinstance.errors, labinstance.warnings), (2, 0))
+        labinstance.record(self.tasks[0], WARNING, 100.0, 'output', 0.5)
+        labinstance.record(self.tasks[1], WARNING, 100.0, 'output', 0.5)
+        self.assertEqual((labinstance.errors, labinstance.warnings), (1, 1))
+
+    def test_pickle(self):
+        labinstance = LabInstance('web1', 'www', 'pmtpa')
+        labinstance.record(self.tasks[0], PASS, 100.0, 'output', 0.5)
+        copy = pickle.loads(pickle.dumps(labinstance, pickle.HIGHEST_PROTOCOL))
+        self.assertEqual(str(copy), 'web1.pmtpa.wmflabs')
+        self.assertEqual((copy.errors, copy.outputs), (labinstance.errors, {self.tasks[0]: 'output'}))
+
+
+if __name__ == '__main__':
+    unittest.main()
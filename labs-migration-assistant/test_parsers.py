@@ -0,0 +1,136 @@
+import unittest
+
+import parsers
+
+
+LAST_RUN_SUMMARY = '''---
+  version:
+    config: 1380000000
+    puppet: "2.7.11"
+  resources:
+    changed: 0
+    failed: 0
+    total: 120
+  time:
+    config_retrieval: 2.5
+    total: 12.3
+    last_run: 1380000000
+  changes:
+    total: 0
+  events:
+    failure: 0
+    total: 0
+'''
+
+
+class LinesTest(unittest.TestCase):
+
+    def test_lines(self):
+        self.assertEqual(parsers.lines(' a \n\n  b\r\n'), ['a', 'b'])
+
+    def test_no_output(self):
+        self.assertEqual(parsers.lines(None), [])
+        self.assertEqual(parsers.lines(''), [])
+
+
+class ConfigValuesTest(unittest.TestCase):
+
+    def test_values(self):
+        output = '[main]\nserver = virt0.wikimedia.org\n# server = old\n; server = older\n' \
+                 '[agent]\nserver=labs-puppetmaster\n'
+        self.assertEqual(parsers.config_values(output, 'server'),
+                         ['virt0.wikimedia.org', 'labs-puppetmaster'])
+
+    def test_other_keys(self):
+        self.assertEqual(parsers.config_values('servername = a\nserver_port = 8140\n', 'server'), [])
+
+
+class DfFilesystemTest(unittest.TestCase):
+
+    def test_filesystem(self):
+        output = 'Filesystem     1K-blocks  Used Available Use% Mounted on\n' \
+                 '/dev/vda1        1000000  5000    995000   1% /\n'
+        self.assertEqual(parsers.df_filesystem(output), '/dev/vda1')
+
+    def test_long_filesystem(self):
+        output = 'Filesystem     1K-blocks  Used Available Use% Mounted on\n' \
+                 'projectstorage.pmtpa.wmnet:/project-home\n' \
+                 '                 1000000  5000    995000   1% /home\n'
+        self.assertEqual(parsers.df_filesystem(output), 'projectstorage.pmtpa.wmnet:/project-home')
+
+    def test_unexpected_output(self):
+        self.assertRaises(ValueError, parsers.df_filesystem, 'df: /home: No such file or directory')
+
+
+class VersionTest(unittest.TestCase):
+
+    def test_version(self):
+        self.assertEqual(parsers.version('12.04\n'), 12.04)
+        self.assertEqual(parsers.version('10'), 10.0)
+
+    def test_not_a_version(self):
+        self.assertEqual(parsers.version('No LSB modules are available.\n12.04'), None)
+        self.assertEqual(parsers.version(''), None)
+        self.assertEqual(parsers.version(None), None)
+
+
+class TableColumnTest(unittest.TestCase):
+
+    def test_column(self):
+        self.assertEqual(parsers.table_column('Database\nmysql\nwiki\n', 'Database'), ['mysql', 'wiki'])
+
+    def test_empty_table(self):
+        self.assertEqual(parsers.table_column('Database\n', 'Database'), [])
+
+    def test_other_output(self):
+        self.assertRaises(ValueError, parsers.table_column, 'ERROR 1045 (28000): Access denied',
+                          'Database')
+
+
+class YamlScalarTest(unittest.TestCase):
+
+    def test_last_run_summary(self):
+        self.assertEqual(parsers.yaml_scalar(LAST_RUN_SUMMARY, 'time', 'last_run'), '1380000000')
+        self.assertEqual(parsers.yaml_scalar(LAST_RUN_SUMMARY, 'events', 'total'), '0')
+
+    def test_missing_key(self):
+        self.assertEqual(parsers.yaml_scalar(LAST_RUN_SUMMARY, 'time', 'missing'), None)
+        self.assertEqual(parsers.yaml_scalar(LAST_RUN_SUMMARY, 'missing', 'last_run'), None)
+
+    def test_mapping_is_not_a_scalar(self):
+        self.assertEqual(parsers.yaml_scalar(LAST_RUN_SUMMARY, 'time'), None)
+
+    def test_quoted_scalar(self):
+        self.assertEqual(parsers.yaml_scalar(LAST_RUN_SUMMARY, 'version', 'puppet'), '2.7.11')
+        self.assertEqual(parsers.yaml_scalar("time:\n  last_run: '5'\n", 'time', 'last_run'), '5')
+
+    def test_comment(self):
+        self.assertEqual(parsers.yaml_scalar('time:\n  last_run: 5 # seconds\n', 'time', 'last_run'), '5')
+
+    def test_anchor_and_alias(self):
+        output = 'time:\n  last_run: &last 5\nprevious:\n  last_run: *last\n'
+        self.assertEqual(parsers.yaml_scalar(output, 'time', 'last_run'), '5')
+        self.assertEqual(parsers.yaml_scalar(output, 'previous', 'last_run'), '5')
+
+    def test_key_in_other_mapping(self):
+        output = 'resources:\n  last_run: 1\ntime:\n  last_run: 2\n'
+        self.assertEqual(parsers.yaml_scalar(output, 'time', 'last_run'), '2')
+
+    def test_key_in_nested_mapping(self):
+        output = 'time:\n  nested:\n    last_run: 1\n  last_run: 2\n'
+        self.assertEqual(parsers.yaml_scalar(output, 'time', 'last_run'), '2')
+
+    def test_end_of_mapping(self):
+        output = 'time:\n  total: 1\nlast_run: 3\n'
+        self.assertEqual(parsers.yaml_scalar(output, 'time', 'last_run'), None)
+
+    def test_flow_style(self):
+        self.assertEqual(parsers.yaml_scalar('time: {last_run: 7}\n', 'time', 'last_run'), '7')
+
+    def test_invalid_document(self):
+        self.assertEqual(parsers.yaml_scalar('time: [1\n', 'time'), None)
+        self.assertEqual(parsers.yaml_scalar(None, 'time', 'last_run'), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import subprocess
+import unittest
+
+import probe
+
+from probe import MARKER, CommandResult
+
+
+def reply(*lines):
+    return '\n'.join(line.replace('@@', MARKER) for line in lines)
+
+
+class BuildPayloadTest(unittest.TestCase):
+
+    def run_payload(self, commands):
+        # commands that run as root are not wrapped in sudo
+        payload = probe.build_payload([(name, command, True, guard)
+                                       for name, command, guard in commands])
+        return probe.parse_reply(subprocess.check_output(['/bin/sh', '-c', payload]))
+
+    def test_output_and_status(self):
+        results = self.run_payload([
+            ('greeting', "echo 'it''s' here; echo two", None),
+            ('failing', 'echo oops >&2; exit 3', None)])
+        self.assertEqual(results['greeting'].output, "its here\ntwo")
+        self.assertEqual(results['greeting'].status, 0)
+        self.assertEqual(results['failing'][:2], ('oops', 3))
+
+    def test_guards(self):
+        results = self.run_payload([
+            ('config', 'false', None),
+            ('skipped', 'echo never', 'config'),
+            ('present', 'true', None),
+            ('guarded', 'echo once', 'present')])
+        self.assertEqual(results['skipped'], CommandResult(None, None, None))
+        self.assertEqual(results['guarded'][:2], ('once', 0))
+
+    def test_user_commands(self):
+        payload = probe.build_payload([('home', "ls 'my files'", False, None)])
+        self.assertTrue('sudo -H -u "${SUDO_USER:-$USER}" /bin/sh -c %s' %
+                        probe.quote("cd && ls 'my files'") in payload)
+
+    def test_quote(self):
+        command = "echo 'it'\\''s' \"$HOME\""
+        self.assertEqual(subprocess.check_output(['/bin/sh', '-c', 'echo %s' % probe.quote(command)]),
+                         command + '\n')
+
+
+class ParseReplyTest(unittest.TestCase):
+
+    def test_commands(self):
+        results = probe.parse_reply(reply(
+            '@@ begin puppet_conf 100.0',
+            '[main]',
+            'server = virt0.wikimedia.org\r',
+            '@@ end puppet_conf 0 100.5',
+            '@@ begin mysql_databases 101.0',
+            '@@ end mysql_databases 1 101.25',
+            '@@ skip mysql_running'))
+        self.assertEqual(results, {
+            'puppet_conf': CommandResult('[main]\nserver = virt0.wikimedia.org', 0, 0.5),
+            'mysql_databases': CommandResult('', 1, 0.25),
+            'mysql_running': CommandResult(None, None, None),
+        })
+
+    def test_unfinished_command(self):
+        results = probe.parse_reply(reply(
+            '@@ begin home_listing 100.0',
+            'file1'))
+        self.assertEqual(results, {})
+
+    def test_timestamps_without_nanoseconds(self):
+        results = probe.parse_reply(reply(
+            '@@ begin home_listing 100.%N',
+            '@@ end home_listing 0 101.%N'))
+        self.assertEqual(results, {'home_listing': CommandResult('', 0, None)})
+
+    def test_bare_marker(self):
+        results = probe.parse_reply(reply(
+            '@@',
+            '@@ begin home_listing 100.0',
+            '@@',
+            '@@ end home_listing 0 100.5'))
+        self.assertEqual(results, {'home_listing': CommandResult('', 0, 0.5)})
+
+    def test_garbled_status(self):
+        results = probe.parse_reply(reply(
+            '@@ begin home_listing 100.0',
+            '@@ end home_listing ?? 100.5',
+            '@@ begin home_filesystem 101.0',
+            '@@ end home_filesystem 0 101.5'))
+        self.assertEqual(results, {'home_filesystem': CommandResult('', 0, 0.5)})
+
+    def test_end_of_other_command(self):
+        results = probe.parse_reply(reply(
+            '@@ begin home_listing 100.0',
+            '@@ end puppet_conf 0 100.5'))
+        self.assertEqual(results, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
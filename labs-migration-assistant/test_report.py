@@ -0,0 +1,76 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import checks
+import report
+
+from checks import PASS, WARNING
+from labinstance import LabInstance
+
+
+class HostRecordTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tasks = checks.names()[:2]
+        LabInstance.select(self.tasks)
+        self.labinstance = LabInstance('web1', 'www', 'pmtpa')
+        self.labinstance.connect = True
+        self.labinstance.record(self.tasks[0], PASS, 100.0, 'output', 0.5)
+        self.labinstance.record(self.tasks[1], WARNING, 100.0, 'output', 0.25)
+
+    def tearDown(self):
+        LabInstance.selected = None
+
+    def test_selected_tests(self):
+        record = report.host_record(self.labinstance, self.tasks)
+        self.assertEqual(record['host'], 'web1.pmtpa.wmflabs')
+        self.assertEqual(record['results'], {self.tasks[0]: 'PASS', self.tasks[1]: 'WARNING'})
+        # the tests that did not run are not counted
+        self.assertEqual((record['errors'], record['warnings']), (0, 1))
+        self.assertEqual(record['durations'], {self.tasks[0]: 0.5, self.tasks[1]: 0.25})
+        self.assertFalse(report.is_unreachable(record, self.tasks))
+
+    def test_unreachable(self):
+        labinstance = LabInstance('web2', 'www', 'pmtpa')
+        labinstance.connect = False
+        labinstance.reuse(self.tasks[0], PASS)
+        record = report.host_record(labinstance, self.tasks)
+        self.assertEqual((record['errors'], record['warnings']), (1, 0))
+        self.assertTrue(report.is_unreachable(record, self.tasks))
+        self.assertFalse(report.is_unreachable(record, self.tasks[:1]))
+
+
+class ReadRecordsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_written_records(self):
+        path = os.path.join(self.directory, 'report.jsonl')
+        records = [{'host': 'web1', 'errors': 0}, {'host': 'web2', 'errors': 2}]
+        reporter = report.Reporter(path, ['check_puppet'])
+        reporter.start()
+        for record in records:
+            reporter.write(record)
+        self.assertEqual(list(report.read_records(path)), records)
+
+    def test_incomplete_record(self):
+        path = os.path.join(self.directory, 'report.jsonl')
+        with open(path, 'w') as fh:
+            fh.write('{"host": "web1"}\n{"host": "we')
+        self.assertEqual(list(report.read_records(path)), [{'host': 'web1'}])
+
+    def test_csv(self):
+        self.assertRaises(ValueError, list, report.read_records('report.csv'))
+
+    def test_missing_report(self):
+        self.assertRaises(IOError, list, report.read_records(os.path.join(self.directory, 'none.jsonl')))
+
+
+if __name__ == '__main__':
+    unittest.main()
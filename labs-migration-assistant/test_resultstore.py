@@ -0,0 +1,162 @@
+import time
+import shutil
+import logging
+import tempfile
+import unittest
+
+from fabric.api import env
+
+import checks
+import fabfile
+
+from checks import PASS, WARNING, FAIL
+from labinstance import LabInstance
+from resultstore import ResultStore
+
+
+class ResultStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        env.cache_dir = self.directory
+        self.tasks = checks.names()
+        self.labinstance = LabInstance('web1', 'www', 'pmtpa')
+        self.labinstance.connect = True
+
+    def tearDown(self):
+        del env['cache_dir']
+        shutil.rmtree(self.directory)
+
+    def test_update_and_save(self):
+        self.labinstance.record(self.tasks[0], PASS, 100.0, 'output', 0.5)
+        store = ResultStore('alice')
+        store.update(self.labinstance)
+        store.save()
+        self.assertEqual(ResultStore('alice').get('web1.pmtpa.wmflabs', self.tasks[0]),
+                         {'time': 100.0, 'result': 'PASS', 'output': 'output'})
+        self.assertEqual(ResultStore('alice').get('web1.pmtpa.wmflabs', self.tasks[1]), None)
+        self.assertEqual(ResultStore('bob').get('web1.pmtpa.wmflabs', self.tasks[0]), None)
+
+    def test_is_fresh(self):
+        now = time.time()
+        self.labinstance.record(self.tasks[0], PASS, now - 60, None, 0.5)
+        self.labinstance.record(self.tasks[1], PASS, now - 7200, None, 0.5)
+        self.labinstance.record(self.tasks[2], WARNING, now - 60, None, 0.5)
+        self.labinstance.record(self.tasks[3], FAIL, now - 60, None, 0.5)
+        store = ResultStore('alice')
+        store.update(self.labinstance)
+        host = str(self.labinstance)
+        self.assertTrue(store.is_fresh(host, self.tasks[0], 3600))
+        self.assertFalse(store.is_fresh(host, self.tasks[1], 3600))
+        self.assertTrue(store.is_fresh(host, self.tasks[1], 86400))
+        self.assertFalse(store.is_fresh(host, self.tasks[2], 3600))
+        self.assertFalse(store.is_fresh(host, self.tasks[3], 3600))
+        self.assertFalse(store.is_fresh(host, self.tasks[4], 3600))
+        self.assertFalse(store.is_fresh('web2.pmtpa.wmflabs', self.tasks[0], 3600))
+
+
+class RestoreResultsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        env.cache_dir = self.directory
+        self.tests = checks.registry[:2]
+        now = time.time()
+        store = ResultStore('alice')
+        done = LabInstance('web1', 'www', 'pmtpa')
+        half = LabInstance('web2', 'www', 'pmtpa')
+        for check in self.tests:
+            done.record(check.name, PASS, now - 60, None, 0.5)
+        half.record(self.tests[0].name, PASS, now - 60, None, 0.5)
+        half.record(self.tests[1].name, PASS, now - 7200, None, 0.5)
+        store.update(done)
+        store.update(half)
+        self.store = store
+        env.labinstances = dict((str(labinstance), labinstance) for labinstance in
+                                (LabInstance('web1', 'www', 'pmtpa'), LabInstance('web2', 'www', 'pmtpa')))
+
+    def tearDown(self):
+        for key in ('cache_dir', 'labinstances', 'max_age'):
+            env.pop(key, None)
+        shutil.rmtree(self.directory)
+
+    def test_reuse_fresh_results(self):
+        env.max_age = '3600'
+        remaining = fabfile.restore_results(self.store, self.tests, sorted(env.labinstances))
+        self.assertEqual(remaining, ['web2.pmtpa.wmflabs'])
+        done = env.labinstances['web1.pmtpa.wmflabs']
+        self.assertTrue(done.connect)
+        self.assertEqual([done.is_reused(check.name) for check in self.tests], [True, True])
+        self.assertEqual(done.result_name(self.tests[0].name), 'PASS')
+        half = env.labinstances['web2.pmtpa.wmflabs']
+        self.assertEqual(half.connect, None)
+        self.assertEqual([half.is_reused(check.name) for check in self.tests], [True, False])
+
+    def test_max_age(self):
+        env.max_age = '86400'
+        self.assertEqual(fabfile.restore_results(self.store, self.tests, sorted(env.labinstances)), [])
+        env.max_age = '10'
+        self.assertEqual(fabfile.restore_results(self.store, self.tests, sorted(env.labinstances)),
+                         ['web1.pmtpa.wmflabs', 'web2.pmtpa.wmflabs'])
+
+
+class TimeoutsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        env.cache_dir = self.directory
+
+    def tearDown(self):
+        for key in ('cache_dir', 'ignored_hosts', 'max_timeouts'):
+            env.pop(key, None)
+        shutil.rmtree(self.directory)
+
+    def run_audit(self, timed_out=False, connect=True, attempts=1, timeouts=0):
+        store = ResultStore('alice')
+        labinstance = LabInstance('web1', 'www', 'pmtpa')
+        labinstance.timed_out = timed_out
+        labinstance.connect = connect
+        labinstance.attempts = attempts
+        labinstance.timeouts = timeouts
+        store.update(labinstance)
+        store.save()
+
+    def test_consecutive_timeouts(self):
+        self.run_audit(timed_out=True, connect=False)
+        self.run_audit(connect=False, attempts=3, timeouts=3)
+        self.assertEqual(ResultStore('alice').timed_out_hosts(2), ['web1.pmtpa.wmflabs'])
+        self.assertEqual(ResultStore('alice').timed_out_hosts(3), [])
+
+    def test_reset_once_the_instance_responds(self):
+        self.run_audit(timed_out=True, connect=False)
+        self.run_audit(timed_out=True, connect=False)
+        self.run_audit()
+        self.assertEqual(ResultStore('alice').timed_out_hosts(1), [])
+
+    def test_other_connection_errors(self):
+        self.run_audit(timed_out=True, connect=False)
+        # refused connections, for example, neither count nor reset
+        self.run_audit(connect=False, attempts=3, timeouts=1)
+        self.run_audit(connect=False, attempts=0)
+        self.assertEqual(ResultStore('alice').timeouts, {'web1.pmtpa.wmflabs': 1})
+
+    def test_ignore_hung_hosts(self):
+        env.wiki_username = 'alice'
+        try:
+            for _ in range(3):
+                self.run_audit(timed_out=True, connect=False)
+            env.ignored_hosts = ['web2']
+            logging.disable(logging.WARNING)
+            fabfile.ignore_hung_hosts()
+            self.assertEqual(env.ignored_hosts, ['web2', 'web1'])
+            env.ignored_hosts = []
+            env.max_timeouts = '4'
+            fabfile.ignore_hung_hosts()
+            self.assertEqual(env.ignored_hosts, [])
+        finally:
+            logging.disable(logging.NOTSET)
+            del env['wiki_username']
+
+
+if __name__ == '__main__':
+    unittest.main()
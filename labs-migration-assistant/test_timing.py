@@ -0,0 +1,59 @@
+import os
+import json
+import tempfile
+import unittest
+
+import timing
+
+from labinstance import LabInstance
+
+
+class PercentileTest(unittest.TestCase):
+
+    def test_nearest_rank(self):
+        values = range(1, 101)
+        self.assertEqual(timing.percentile(values, 0.5), 50)
+        self.assertEqual(timing.percentile(values, 0.95), 95)
+        self.assertEqual(timing.percentile(values, 1.0), 100)
+        self.assertEqual(timing.percentile(values, 0.0), 1)
+
+    def test_few_values(self):
+        self.assertEqual(timing.percentile([3.0], 0.95), 3.0)
+        self.assertEqual(timing.percentile([1.0, 2.0], 0.5), 1.0)
+        self.assertEqual(timing.percentile([1.0, 2.0], 0.95), 2.0)
+
+
+class TraceTest(unittest.TestCase):
+
+    def labinstance(self):
+        labinstance = LabInstance('web1', 'www', 'pmtpa')
+        labinstance.attempts = 2
+        labinstance.timeouts = 1
+        labinstance.connect = True
+        labinstance.connect_time = 1.5
+        labinstance.command_time = 0.5
+        labinstance.timings = {'check_ubuntu': 0.25}
+        return labinstance
+
+    def test_spans(self):
+        self.assertEqual([(span['stage'], span['duration']) for span in timing.spans(self.labinstance())],
+                         [('connect', 1.5), ('command', 0.5), ('check_ubuntu', 0.25)])
+        self.assertEqual(timing.spans(LabInstance('web2', 'www', 'pmtpa')), [])
+
+    def test_write_trace(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            timing.write_trace(path, [self.labinstance()])
+            timing.write_trace(path, [self.labinstance()])
+            with open(path) as fh:
+                records = [json.loads(line) for line in fh]
+        finally:
+            os.remove(path)
+        self.assertEqual(len(records), 6)
+        self.assertEqual(records[0], {'host': 'web1.pmtpa.wmflabs', 'project': 'www', 'stage': 'connect',
+                                      'duration': 1.5, 'attempts': 2, 'timeouts': 1, 'ok': True})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+'''
+Report where the time of an audit goes.
+
+For every instance we know how long it took to connect (and how many
+attempts and timeouts that took), how long the probe took and how long each
+test took on the instance, including interpreting its output. These
+measurements can be written to a JSON lines trace, one record per
+measurement, using --set trace=FILENAME. At the end of a run a table with
+the median, 95th percentile and maximum duration of every stage is logged.
+'''
+
+import math
+import json
+import logging
+
+
+def spans(labinstance):
+    '''
+    Return the measurements of a single instance as dictionaries.
+    '''
+    host = str(labinstance)
+    records = []
+    if labinstance.attempts:
+        records.append({'host': host, 'project': labinstance.project,
+                        'stage': 'connect', 'duration': labinstance.connect_time,
+                        'attempts': labinstance.attempts,
+                        'timeouts': labinstance.timeouts,
+                        'ok': bool(labinstance.connect)})
+    if labinstance.command_time is not None:
+        records.append({'host': host, 'project': labinstance.project,
+                        'stage': 'command', 'duration': labinstance.command_time})
+    for task, duration in sorted((labinstance.timings or {}).iteritems()):
+        records.append({'host': host, 'project': labinstance.project,
+                        'stage': task, 'duration': duration})
+    return records
+
+
+def write_trace(path, labinstances):
+    with open(path, 'a') as fh:
+        for labinstance in labinstances:
+            for record in spans(labinstance):
+                fh.write('%s\n' % json.dumps(record))
+
+
+def percentile(values, fraction):
+    '''
+    Nearest-rank percentile of a sorted list.
+    '''
+    position = int(math.ceil(fraction * len(values))) - 1
+    return values[min(max(position, 0), len(values) - 1)]
+
+
+def output_timings(labinstances):
+    stages = {}
+    attempts = timeouts = 0
+    for labinstance in labinstances:
+        attempts += labinstance.attempts
+        timeouts += labinstance.timeouts
+        for record in spans(labinstance):
+            stages.setdefault(record['stage'], []).append(record['duration'])
+    if not stages:
+        return
+    logging.info('***** Timings *****')
+    logging.info('%-40s %6s %8s %8s %8s' % ('stage', 'count', 'p50', 'p95', 'max'))
+    for stage in sorted(stages, key=lambda stage: ({'connect': 0, 'command': 1}.get(stage, 2), stage)):
+        values = sorted(stages[stage])
+        logging.info('%-40s %6d %7.2fs %7.2fs %7.2fs' % (
+            stage, len(values), percentile(values, 0.5), percentile(values, 0.95), values[-1]))
+    logging.info('%d connection attempts, %d of them timed out.' % (attempts, timeouts))